@@ -1,10 +1,15 @@
 from .lib.datamonster import DataMonster, DimensionSet  # noqa
 from .lib.aggregation import Aggregation  # noqa
+from .lib.checkpoint import CheckpointJournal  # noqa
 from .lib.company import Company  # noqa
+from .lib.fiscal_calendar import FiscalCalendar  # noqa
 from .lib.datasource import Datasource  # noqa
+from .lib.decoding import DtypePolicy, RowFilter  # noqa
 from .lib.data_group import DataGroup, DataGroupColumn  # noqa
 from .lib.errors import DataMonsterError  # noqa
-from .lib.utils import format_date  # noqa
+from .lib.local_store import LocalStore  # noqa
+from .lib.planner import CoveragePlanner  # noqa
+from .lib.utils import format_date, format_dates  # noqa
 from .__version__ import __version__  # noqa
 
 name = "datamonster_api"
@@ -1,3 +1,5 @@
+import datetime
+
 from .company import Company
 from .errors import DataMonsterError
 
@@ -12,6 +14,21 @@ class Aggregation(object):
         "week": "weekly",
     }
 
+    # pandas period frequencies used to aggregate locally
+    local_period_map = {
+        "quarter": "Q",
+        "month": "M",
+        "week": "W",
+    }
+
+    # aggregationType of a data source => pandas aggregation function
+    local_aggregation_map = {
+        "sum": "sum",
+        "mean": "mean",
+        "avg": "mean",
+        "average": "mean",
+    }
+
     def __init__(self, period, company):
         """Initialize an Aggregation
 
@@ -37,6 +54,55 @@ class Aggregation(object):
 
         return agg_dict
 
+    def aggregate(self, schema, df, aggregation_type='sum'):
+        """Aggregate raw data into this period on the client side
+
+        Rows are assigned to the period holding their last day, and values are combined per period and
+        combination of split values (and ``section_pk``). As with server side aggregation, periods that
+        are not complete at the last date in ``df`` are dropped, and so are those starting before the first
+        date in ``df``, which it only covers in part. Weeks run from Monday to Sunday, and
+        quarters are calendar quarters, or for ``fiscalQuarter`` those of ``company.fiscal_calendar``.
+
+        :param schema: (dict) schema returned by ``DataMonster.get_data_raw``
+        :param df: pandas.DataFrame returned by ``DataMonster.get_data_raw`` for unaggregated data
+        :param aggregation_type: (str) ``aggregationType`` of the data source: `sum` or `mean`
+
+        :return: pandas.DataFrame with the columns of ``df``, one row per period and combination of splits
+        """
+        how = self.local_aggregation_map.get(aggregation_type)
+        if how is None:
+            raise DataMonsterError("Cannot aggregate {!r} data locally".format(aggregation_type))
+
+        if df.empty:
+            return df.copy()
+
+        lower, upper, value = schema["lower_date"][0], schema["upper_date"][0], schema["value"][0]
+        keys = [col for col in schema.get("split", []) + schema.get("section_pk", []) if col in df]
+
+        # the upper date is exclusive, so the last day covered by a row is the day before it
+        last_day = df[upper] - datetime.timedelta(days=1)
+        period_start, period_end = self._period_bounds(last_day)
+
+        grouped = df[keys + [value]].assign(**{lower: period_start, upper: period_end})
+        grouped = grouped[
+            grouped[upper].notnull() & (grouped[lower] >= df[lower].min()) & (grouped[upper] <= df[upper].max())
+        ]
+        return grouped.groupby(keys + [lower, upper], sort=False)[value].agg(how).reset_index()
+
+    def _period_bounds(self, days):
+        """Return the start and exclusive end of the period holding each of ``days``
+
+        :param days: pandas.Series of datetime64
+        :return: (pandas.Series, pandas.Series), NaT where a day is outside of every known period
+        """
+        if self.period == "fiscalQuarter":
+            return self.company.fiscal_calendar.period_bounds(days)
+
+        periods = days.dt.to_period(self.local_period_map[self.period])
+        start = periods.dt.start_time
+        end = periods.dt.end_time.dt.normalize() + datetime.timedelta(days=1)
+        return start, end
+
     def aggregation_sanity_check(self, company=None):
         if self.period is not None and self.period not in self.aggregation_period_map:
             raise DataMonsterError(
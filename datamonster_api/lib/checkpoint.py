@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class CheckpointJournal(object):
+    """Journal of the units of work of a bulk job that are done, kept in a local file so that a job
+    interrupted halfway through can be run again and skip them
+
+    The file has one JSON line per unit done, appended and synced to disk as soon as the unit is done,
+    so that at most the units in progress are lost if the process dies. A last line cut short by
+    the process dying is ignored. The units a job is split into can be recorded too, with ``plan``, so
+    that they stay the same when the job is run again.
+
+    :param path: (str) path of the journal file, created if it does not exist
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+        self._plans = {}
+
+        if os.path.exists(path):
+            with open(path, "r") as fp:
+                content = fp.read()
+            for line in content.splitlines():
+                try:
+                    record = json.loads(line)
+                    if "plan" in record:
+                        self._plans[record["plan"]] = record["units"]
+                    else:
+                        self._done.add(record["key"])
+                except (ValueError, KeyError, TypeError):
+                    pass
+            if content and not content.endswith("\n"):
+                with open(path, "a") as fp:
+                    fp.write("\n")
+
+    def __repr__(self):
+        return "<{}: {}, {} units done>".format(self.__class__.__name__, self.path, len(self._done))
+
+    def __len__(self):
+        return len(self._done)
+
+    @staticmethod
+    def unit_key(unit):
+        """
+        :param unit: (dict) description of a unit of work, made of JSON serializable values
+        :return: (str) key identifying the unit
+        """
+        return hashlib.sha1(json.dumps(unit, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def is_done(self, unit):
+        """
+        :param unit: (dict) description of a unit of work
+        :return: (bool) whether the unit is recorded as done
+        """
+        return self.unit_key(unit) in self._done
+
+    def mark_done(self, unit):
+        """Record the unit as done
+
+        :param unit: (dict) description of a unit of work
+        """
+        key = self.unit_key(unit)
+        with self._lock:
+            self._append({"key": key, "unit": unit})
+            self._done.add(key)
+
+    def plan(self, job, create):
+        """Get the units of work of a job as planned the first time it was run
+
+        :param job: (dict) description of the job, made of JSON serializable values
+        :param create: function returning the JSON serializable units of the job, only called if they are
+            not recorded yet
+        :return: the units of the job
+        """
+        key = self.unit_key(job)
+        with self._lock:
+            if key not in self._plans:
+                units = create()
+                self._append({"plan": key, "units": units})
+                self._plans[key] = units
+            return self._plans[key]
+
+    def _append(self, record):
+        with open(self.path, "a") as fp:
+            fp.write(json.dumps(record, sort_keys=True, default=str) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
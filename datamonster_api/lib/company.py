@@ -1,4 +1,5 @@
 from .base import BaseClass
+from .fiscal_calendar import FiscalCalendar
 
 
 class Company(BaseClass):
@@ -20,6 +21,11 @@ class Company(BaseClass):
     """
 
     _details = None
+    _fiscal_calendars = None
+
+    # month in which the fiscal year of the company ends, for `fiscal_calendar`. Set it on companies
+    # whose fiscal year does not end in December
+    fiscal_year_end_month = 12
 
     def __init__(self, _id, ticker, name, uri, dm):
         self.id = _id
@@ -56,6 +62,33 @@ class Company(BaseClass):
 
         return self._datasources
 
+    @property
+    def fiscal_calendar(self):
+        """
+        :return: ``FiscalCalendar`` built from ``quarters``, with fiscal years ending in ``fiscal_year_end_month``,
+            memoized
+        """
+        return self.get_fiscal_calendar()
+
+    def get_fiscal_calendar(self, fiscal_year_end_month=None):
+        """
+        :param fiscal_year_end_month: (optional, int) month in which the fiscal year ends. Defaults to
+            ``fiscal_year_end_month``
+        :return: ``FiscalCalendar`` built from ``quarters``, memoized until the details of the company change
+        """
+        if fiscal_year_end_month is None:
+            fiscal_year_end_month = self.fiscal_year_end_month
+        if self._fiscal_calendars is None:
+            self._fiscal_calendars = {}
+        if fiscal_year_end_month not in self._fiscal_calendars:
+            self._fiscal_calendars[fiscal_year_end_month] = FiscalCalendar.from_company(self, fiscal_year_end_month)
+
+        return self._fiscal_calendars[fiscal_year_end_month]
+
+    def set_details(self, details):
+        super(Company, self).set_details(details)
+        self._fiscal_calendars = None
+
     def get_details(self):
         """
         Get details (metadata) for this company,
@@ -1,12 +1,46 @@
 from .base import BaseClass
-from .errors import DataMonsterError
+from .errors import DataMonsterError, DataTooLargeError
+import itertools
+import json
+import time
 import numpy as np
+import pandas as pd
 from io import BytesIO
-from .utils import dataframe_to_avro_bytes
+from .utils import (
+    avro_dump,
+    dataframe_avro_schema,
+    dataframe_content_hash,
+    dataframe_records,
+    dataframe_to_avro,
+    estimate_avro_size,
+    format_dates,
+    read_dataframe_chunks,
+)
 
 date_regex = r'\d{4}-\d{2}-\d{2}'
 max_file_size = 64 * 1024 * 1024  # flask server only allows 64MB files
-data_frame_cutoff_size = 2 * max_file_size  # Don't even make an avro file if the df is too big
+too_large_message = 'Data Too Large. Data Groups can be refreshed with data < 64 MB.'
+
+
+def write_refresh_data(fp, data_frame):
+    """Encode ``data_frame`` into ``fp`` in the format expected by the DataGroup refresh endpoint
+
+    :raises: ``DataMonsterError`` if the encoded data would exceed the 64 MB upload limit
+    """
+    if estimate_avro_size(data_frame) > max_file_size:
+        raise DataMonsterError(too_large_message)
+
+    try:
+        dataframe_to_avro(fp, data_frame, 'upload_data', 'com.adaptivemgmt.upload', max_size=max_file_size)
+    except DataTooLargeError:
+        raise DataMonsterError(too_large_message)
+
+
+def encode_refresh_data(data_frame):
+    """Return ``data_frame`` encoded by ``write_refresh_data``. Picklable, for use with process pools"""
+    fp = BytesIO()
+    write_refresh_data(fp, data_frame)
+    return fp.getvalue()
 
 
 class DataGroup(BaseClass):
@@ -46,22 +80,114 @@ class DataGroup(BaseClass):
         """
         return self.dm.get_data_group_details(self.id)
 
-    def start_data_refresh(self, data_frame):
-        self._accepts(data_frame)
-        if sum(data_frame.memory_usage()) > data_frame_cutoff_size:
-            raise DataMonsterError('Data Too Large. Data Groups can be refreshed with data < 64 MB.')
+    def start_data_refresh(self, data_frame, skip_unchanged=False):
+        """
+        Upload ``data_frame`` to DataMonster and start refreshing this DataGroup with it.
+
+        The data is encoded block by block, and encoding stops as soon as the output
+        grows past the 64 MB upload limit.
+
+        :param data_frame: pandas.DataFrame whose columns match ``self.columns``. Date columns may hold
+            YYYY-MM-DD strings or datetime values
+        :param skip_unchanged: (optional, bool) if ``True``, do nothing when ``data_frame`` has the same
+            content as the last successful upload to this DataGroup through the same ``DataMonster`` object
+
+        :return: the response of the refresh request, or ``None`` if the upload was skipped
 
-        avro_file = BytesIO(dataframe_to_avro_bytes(data_frame, 'upload_data', 'com.adaptivemgmt.upload'))
-        if avro_file.getbuffer().nbytes > max_file_size:
-            raise DataMonsterError('Data Too Large. Data Groups can be refreshed with data < 64 MB.')
+        :raises: ``DataMonsterError`` if the data does not match the DataGroup's columns
+            or is too large to upload
+        """
+        content_hash = dataframe_content_hash(data_frame) if skip_unchanged else None
+        if self._is_last_upload(content_hash):
+            return None
+
+        avro_file = self._encode_refresh_data(data_frame)
+        return self._post_refresh(avro_file, content_hash)
+
+    def start_data_refresh_from_file(self, path, chunk_size=100000):
+        """
+        Upload a local Parquet or CSV file to DataMonster and start refreshing this DataGroup with it.
+
+        The file is read, validated and encoded ``chunk_size`` rows at a time, so it is never loaded
+        into a single DataFrame. Only the columns in ``self.columns`` are read; number columns are
+        read as floats and string and date columns as strings.
+
+        :param path: (str) path of a ``.parquet``/``.pq`` or ``.csv`` file
+        :param chunk_size: (optional, int) number of rows read at a time
 
+        :raises: ``DataMonsterError`` if the file is empty, not a Parquet or CSV file,
+            does not match the DataGroup's columns or is too large to upload
+        """
+        names = [col.name for col in self.columns]
+        dtypes = {col.name: float if col.type_ == 'number' else str for col in self.columns}
+        chunks = read_dataframe_chunks(path, chunk_size, columns=names, dtypes=dtypes)
+
+        first = next(chunks, None)
+        if first is None:
+            raise DataMonsterError('No data found in {}'.format(path))
+        self._accepts(first)
+        schema = json.dumps(dataframe_avro_schema(first, 'upload_data', 'com.adaptivemgmt.upload'))
+
+        def records():
+            for chunk in itertools.chain([first], chunks):
+                if chunk is not first:
+                    self._accepts(chunk)
+                for record in dataframe_records(chunk):
+                    yield record
+
+        avro_file = BytesIO()
+        try:
+            avro_dump(avro_file, records(), schema, max_size=max_file_size)
+        except DataTooLargeError:
+            raise DataMonsterError(too_large_message)
+        avro_file.seek(0)
+        return self._post_refresh(avro_file)
+
+    def _is_last_upload(self, content_hash):
+        """Return True iff ``content_hash`` is the hash of the last successful upload to this DataGroup"""
+        return content_hash is not None and self.dm._get_upload_hash(self.id) == content_hash
+
+    def _encode_refresh_data(self, data_frame, executor=None):
+        """Validate ``data_frame`` and encode it for upload
+
+        :param executor: (optional) ``concurrent.futures.Executor``, e.g. a process pool, to run the encoding in
+        :return: file-like object holding the encoded data
+        """
+        data_frame = self._format_date_columns(data_frame)
+        self._accepts(data_frame)
+        if executor is not None:
+            return BytesIO(executor.submit(encode_refresh_data, data_frame).result())
+
+        avro_file = BytesIO()
+        write_refresh_data(avro_file, data_frame)
+        avro_file.seek(0)
+        return avro_file
+
+    def _format_date_columns(self, df):
+        """Return ``df`` with the datetime values of its date columns formatted as YYYY-MM-DD strings"""
+        formatted = {}
+        for col in self.columns:
+            if col.type_ == 'date' and col.name in df.columns and \
+                    pd.api.types.infer_dtype(df[col.name]) in ('date', 'datetime', 'datetime64'):
+                try:
+                    formatted[col.name] = format_dates(df[col.name])
+                except ValueError:
+                    # left as is, to be reported by _accepts
+                    pass
+        return df.assign(**formatted) if formatted else df
+
+    def _post_refresh(self, avro_file, content_hash=None):
         files = {'avro_file': avro_file}
         headers = {'Accept': 'avro/binary'}
         try:
-            return self.dm.client.post(self._get_refresh_url(), {}, headers=headers, files=files)
+            resp = self.dm.client.post(self._get_refresh_url(), {}, headers=headers, files=files)
         except Exception:
             raise DataMonsterError('Unknown problem refreshing data. Please contact DataMonster Customer Service.')
 
+        if content_hash is not None:
+            self.dm._set_upload_hash(self.id, content_hash)
+        return resp
+
     def _get_refresh_url(self):
         return '{}/refresh'.format(self.dm._get_data_group_path(self.id))
 
@@ -84,23 +210,44 @@ class DataGroup(BaseClass):
 
         if res['_id'] == self.id and res['status'] is not None:
             self.status = res['status']
+            if self.status == 'error':
+                # make sure the same data can be sent again
+                self.dm._set_upload_hash(self.id, None)
             return self.status
 
         raise DataMonsterError('Unknown problem fetching current status. ' +
                                'Please contact DataMonster Customer Service.')
 
+    def wait_for_refresh(self, poll_interval=1, max_poll_interval=60, timeout=None):
+        """
+        Poll ``get_current_status`` until this DataGroup is no longer processing.
+        The wait between polls starts at ``poll_interval`` seconds and doubles after each poll,
+        up to ``max_poll_interval``.
+
+        :param poll_interval: (optional, float) seconds to wait before the first poll. Must be positive
+        :param max_poll_interval: (optional, float) longest wait between two polls, in seconds
+        :param timeout: (optional, float) stop polling after this many seconds
+
+        :return: The status of this DataGroup: `success` or `error`,
+            or `processing` if ``timeout`` was reached first
+        """
+        if poll_interval <= 0:
+            raise DataMonsterError('poll_interval must be positive, got {}'.format(poll_interval))
+
+        deadline = None if timeout is None else time.time() + timeout
+        interval = poll_interval
+        while True:
+            if deadline is not None:
+                interval = min(interval, max(deadline - time.time(), 0))
+            time.sleep(interval)
+            status = self.get_current_status()
+            if status != 'processing' or (deadline is not None and time.time() >= deadline):
+                return status
+            interval = min(interval * 2, max_poll_interval)
+
     def _get_status_url(self):
         return '{}/status'.format(self.dm._get_data_group_path(self.id))
 
-    @staticmethod
-    def _get_dgctype_(column):
-        if hasattr(column, 'str') and column.str.match(date_regex).any():
-            return 'date'
-        elif np.issubdtype(column, np.number):
-            return 'number'
-        elif np.issubdtype(column, np.object_) or np.issubdtype(column, np.str_):
-            return 'string'
-
     @staticmethod
     def _construct_error_message(missing, extras, bad_dates):
         msg = ['Invalid DataFrame Schema:']
@@ -128,22 +275,29 @@ class DataGroup(BaseClass):
         """Check if the schema of a provided pandas dataframe matches the expected columns"""
         extra = []
 
+        # Each column is profiled at most once and shared by all of the checks below
+        profiles = {}
+
+        def profile(name):
+            if name not in profiles:
+                profiles[name] = _ColumnProfile(df[name])
+            return profiles[name]
+
         # Find missing columns
-        missing = [col for col in self.columns if not col._exists_in_df(df)]
+        missing = [col for col in self.columns if col.name not in df.columns or
+                   not col._exists_in_df(df, profile(col.name))]
 
         # Find extra columns
         if len(df.columns) + len(missing) != len(self.columns):
             col_names_totype_s = {c.name: c.type_ for c in self.columns}
             for col in df.columns:
-                dgctype_ = self._get_dgctype_(df[col])
+                dgctype_ = profile(col).dgctype_
                 if col not in col_names_totype_s or dgctype_ != col_names_totype_s[col]:
                     extra.append(DataGroupColumn(col, dgctype_))
 
         # Verify date columns are complete
         date_columns = [col for col in self.columns if col.type_ == 'date' and col not in missing]
-        bad_dates = [column for column in date_columns if
-                     not hasattr(df[column.name], 'str') or
-                     not df[column.name].str.match(date_regex).all()]
+        bad_dates = [column for column in date_columns if not profile(column.name).all_dates]
 
         return missing, extra, bad_dates
 
@@ -169,21 +323,59 @@ class DataGroupColumn(object):
     def __repr__(self):
         return "<{}: {}>".format(self.__class__.__name__, self.name)
 
-    def _exists_in_df(self, df):
+    def _exists_in_df(self, df, profile=None):
         """Return true if this DataGroupColumn is represented in ``df``
 
         :param df: Pandas Data Frame
+        :param profile: (optional) ``_ColumnProfile`` already computed for the column of ``df`` named self.name
         :return: True iff a column exists in ``df`` that matches self.name and self.type_
         """
 
         if self.name in df.columns:
-            column = df[self.name]
+            if profile is None:
+                profile = _ColumnProfile(df[self.name])
             if self.type_ == 'string':
-                # pandas maps strings to objects
-                return np.issubdtype(column, np.object_) or np.issubdtype(column, np.str_)
+                return profile.is_string
             elif self.type_ == 'number':
-                return np.issubdtype(column, np.number)
+                return profile.is_number
             elif self.type_ == 'date':
-                return column.str.match(date_regex).any()
+                return profile.has_dates
             else:
                 raise DataMonsterError('Unrecognized column type of column {}'.format(self.name))
+
+
+class _ColumnProfile(object):
+    """Summary of a DataFrame column used to validate it against a ``DataGroupColumn``
+
+    The date pattern is matched once per distinct value of the column, so date columns,
+    which repeat the same few values over many rows, are cheap to check.
+
+    :param column: pandas.Series
+    """
+
+    def __init__(self, column):
+        # pandas maps strings to objects
+        self.is_string = np.issubdtype(column, np.object_) or np.issubdtype(column, np.str_)
+        self.is_number = np.issubdtype(column, np.number)
+
+        self.has_dates = False
+        self.all_dates = False
+        if hasattr(column, 'str'):
+            try:
+                values = pd.Series(column.unique())
+            except TypeError:
+                # unhashable values, e.g. lists
+                values = column
+            matches = values.str.match(date_regex)
+            self.has_dates = bool(matches.any())
+            self.all_dates = bool(matches.all())
+
+    @property
+    def dgctype_(self):
+        """The ``DataGroupColumn`` type that best describes the column"""
+        if self.has_dates:
+            return 'date'
+        elif self.is_number:
+            return 'number'
+        elif self.is_string:
+            return 'string'
@@ -1,14 +1,28 @@
 import datetime
-import fastavro
+import itertools
 import json
+import numpy
+import os
 import pandas
 import six
+import requests
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
+from .aggregation import Aggregation
+from .checkpoint import CheckpointJournal
 from .client import Client
 from .company import Company
 from .data_group import DataGroup, DataGroupColumn
 from .datasource import Datasource
+from .decoding import (
+    RowFilter, concat_frames, decode_avro, decode_avro_arrow, decode_avro_chunked, decode_avro_parallel, empty_data,
+    interned_dimensions, iter_decode_avro,
+)
 from .errors import DataMonsterError
+from .planner import CoveragePlanner
+from .utils import dataframe_content_hash
 
 __all__ = ["DataMonster", "DimensionSet"]
 
@@ -20,6 +34,11 @@ class DataMonster(object):
     :param secret: (str) a user's secret key
     :param server: (optional, str) default to dm.adaptivemgmt.com
     :param verify: (optional, bool) whether to verify the server's TLS certificate
+    :param upload_hash_path: (optional, str) JSON file in which to remember the content of the last
+        successful upload to each data group, so that ``start_data_refresh(..., skip_unchanged=True)``
+        also skips uploads made unnecessary by earlier processes
+    :param local_store: (optional) ``LocalStore`` in which ``get_data`` keeps the data it fetches, shared
+        with the other processes of the host
     """
 
     company_path = "/rest/v1/company"
@@ -28,16 +47,40 @@ class DataMonster(object):
     data_group_path = '/rest/v1/data_group'
     rawdata_path = "/rest/v2/datasource/{}/rawdata"
 
+    # rows fetched again by incremental `get_data` calls, to pick up revisions
+    incremental_lookback = datetime.timedelta(days=7)
+    # seconds to wait before retrying a failed shard of `iter_data_raw_shards`, doubled on each retry
+    shard_retry_wait = 5
+    # seconds the dimension metadata behind `get_coverage` and `estimate_rows` is reused for before being fetched again
+    coverage_max_age = 3600
+    # expected rows up to which `get_data_raw(..., strategy="auto")` reads the whole response before decoding it,
+    # and from which it shards the request into requests of about `auto_shard_rows` rows
+    buffered_max_rows = 200000
+    sharded_min_rows = 5000000
+    auto_shard_rows = 1000000
+    # bytes read from the response at a time by `get_data_raw_bytes`
+    raw_bytes_chunk_size = 1 << 20
+
     DATAMONSTER_SCHEMA_FIELDS = {
         "lower_date": "start_date",
         "upper_date": "end_date",
         "value": "value",
     }
 
-    def __init__(self, key_id, secret, server=None, verify=True):
+    def __init__(self, key_id, secret, server=None, verify=True, upload_hash_path=None, local_store=None):
         self.client = Client(key_id, secret, server, verify)
         self.key_id = key_id
         self.secret = secret
+        self.local_store = local_store
+
+        self._data_cache = {}
+        self._coverage_cache = {}
+        self._row_count_cache = {}
+        self._row_history = {}
+
+        self._upload_hash_path = upload_hash_path
+        self._upload_hashes = None
+        self._upload_hashes_lock = threading.Lock()
 
     def _get_paginated_results(self, url):
         """Get the paginated results starting with this url"""
@@ -237,7 +280,9 @@ class DataMonster(object):
         return ds_inst
 
     def get_data(
-        self, datasource, company, aggregation=None, start_date=None, end_date=None
+        self, datasource, company, aggregation=None, start_date=None, end_date=None, incremental=False,
+        lookback=None, dimensions=None, columns=None, output="pandas", dtypes=None, decode_processes=None,
+        check_coverage=False, limit=None
     ):
         """Get data for data source
 
@@ -246,16 +291,464 @@ class DataMonster(object):
         :param aggregation: Optional ``Aggregation`` object to specify the aggregation of the data
         :param start_date: Optional filter for the start date of the data
         :param end_date: Optional filter for the end date of the data
+        :param incremental: Optional bool. If ``True``, the data for this data source, company and aggregation
+            is kept on this object, and later incremental calls only keep the rows ending after the
+            latest ``end_date`` already held (less ``lookback``) and merge them in. The server has no date
+            filter, so every call still downloads the whole history and decodes each of its records: only the
+            rows before that cutoff are dropped as they are decoded, rather than being mapped into the DataFrame
+            and merged again. Use ``clear_data_cache`` to release the data
+        :param lookback: Optional ``datetime.timedelta``. Rows ending this long before the latest ``end_date``
+            already held are fetched again, to pick up revisions. Defaults to ``incremental_lookback``
+        :param dimensions: Optional dict of split column => value, or list of values, to keep,
+            e.g. ``{'country': 'US'}``
+        :param columns: Optional list of the split columns to keep in ``dimensions``. Other splits are dropped
+            from each record as it is read and never put in the DataFrame, which saves memory, and the time
+            spent building ``dimensions``, when only a few of them are needed
+        :param output: ``"pandas"`` (default) or ``"arrow"`` to get a ``pyarrow.Table``, whose split values
+            are dictionary encoded and whose ``dimensions`` are a struct column, or a null column when no
+            split is kept. Requires pyarrow, and can not be combined with ``incremental``
+        :param dtypes: Optional ``DtypePolicy``, to store the data in less memory. pandas output only
+        :param decode_processes: Optional number of processes to decode large data with. pandas output only,
+            and can not be combined with a ``local_store``, except for incremental calls and ``limit``
+        :param check_coverage: Optional bool. If ``True``, no request is sent when the dimension metadata of
+            the data source, see ``get_coverage``, shows the company has no rows between the dates, and
+            empty data is returned instead. Not applied to incremental calls
+        :param limit: Optional number of rows to get, to preview the data. The rest of the response is
+            not read, see ``get_data_raw``. Can not be combined with ``incremental``, and does not use the
+            ``local_store``
+
+        The dimension filters are sent to the server. Date and dimension filters are also applied
+        while the data is decoded, so rows that do not match them are dropped before any DataFrame is built.
+
+        With a ``local_store``, the data for this server, user, data source, company, aggregation, dimensions
+        and columns is fetched once for all dates and kept in the store, which later calls from any process of the
+        host read instead of fetching it again. Arrow output is then memory-mapped from the store, without
+        copying when no dates are given. Incremental calls do not use the store.
 
         See `here <quickstart.html#>`__ for example usage.
 
-        :return: pandas.DataFrame
+        :return: pandas.DataFrame, or pyarrow.Table
         """
         # todo: support multiple companies
         self._check_param(company=company, datasource=datasource)
+        self._check_output(output)
+        if incremental and output != "pandas":
+            raise DataMonsterError("Incremental data is only kept as pandas DataFrames")
+        if incremental and limit is not None:
+            raise DataMonsterError("limit can not be combined with incremental")
+        self._check_dtypes(dtypes, output)
+        self._check_decode_processes(decode_processes, output)
+        if decode_processes and self.local_store is not None and not incremental and limit is None:
+            raise DataMonsterError("decode_processes can not be combined with a local_store")
+
+        filters = self._dimension_filters([company], dimensions)
+        self._check_date_params(datasource, start_date, end_date)
+
+        if aggregation is not None and aggregation.period == 'fiscalQuarter' and aggregation.company != company:
+            raise DataMonsterError("Aggregating by the fiscal quarter of a different company not yet supported")
+
+        if check_coverage and not incremental and not self.get_coverage(datasource).covers(
+            company.id, start_date, end_date
+        ):
+            return empty_data(datasource.fields, output)
+
+        if incremental:
+            df = self._get_data_incremental(
+                datasource, company, filters, aggregation, lookback, dimensions, columns, dtypes, decode_processes
+            )
+            return self._trim_dates(df.copy(), start_date, end_date)
+
+        if self.local_store is not None and limit is None:
+            return self._get_data_stored(
+                datasource, filters, aggregation, start_date, end_date, dimensions, columns, output, dtypes
+            )
+
+        row_filter = RowFilter(start_date, end_date, dimensions)
+        schema, df = self.get_data_raw(
+            datasource, filters, aggregation, row_filter, self._data_columns(columns), output, dtypes,
+            decode_processes, limit=limit,
+        )
+        if output == "arrow":
+            return self._format_arrow_data(datasource, schema, df, start_date, end_date)
+        return self._format_data(datasource, schema, df, start_date, end_date, dtypes)
+
+    def _get_data_stored(
+        self, datasource, filters, aggregation, start_date, end_date, dimensions, columns, output, dtypes
+    ):
+        """Get the data from the local store, fetching all of its dates into the store if it is not there
+
+        :return: pandas.DataFrame, or pyarrow.Table
+        """
+        # Clients of other servers or users may see other data
+        key = {
+            "server": self.client.server,
+            "key_id": self.key_id,
+            "datasource": datasource.id,
+            "filters": filters,
+            "aggregation": None if aggregation is None else aggregation.to_time_aggregation_dictionary(),
+            "columns": columns,
+        }
+
+        def fetch():
+            schema, table = self.get_data_raw(
+                datasource, filters, aggregation, RowFilter(equals=dimensions), self._data_columns(columns), "arrow"
+            )
+            return self._format_arrow_data(datasource, schema, table, None, None)
+
+        table = self._trim_arrow_dates(self.local_store.get_or_create(key, fetch), start_date, end_date)
+        if output == "arrow":
+            return table
+
+        df = table.to_pandas()
+        if dtypes is not None:
+            dtypes.apply(df)
+        return df
+
+    def _get_data_incremental(
+        self, datasource, company, filters, aggregation, lookback, dimensions, columns, dtypes, decode_processes
+    ):
+        """Update the data held for this request with the rows ending after the latest ``end_date``
+        already held, less ``lookback``
+
+        :return: pandas.DataFrame, all of the data held for this request
+        """
+        if lookback is None:
+            lookback = self.incremental_lookback
+
+        key = (
+            datasource.id,
+            int(company.id),
+            None if aggregation is None else json.dumps(
+                aggregation.to_time_aggregation_dictionary(), sort_keys=True, default=str
+            ),
+            json.dumps(dimensions, sort_keys=True, default=str),
+            None if columns is None else tuple(columns),
+            repr(dtypes),
+        )
+        cached = self._data_cache.get(key)
+        columns = self._data_columns(columns)
+
+        if cached is None or cached.empty or "end_date" not in cached:
+            schema, df = self.get_data_raw(
+                datasource, filters, aggregation, RowFilter(equals=dimensions), columns, dtypes=dtypes,
+                decode_processes=decode_processes,
+            )
+            df = self._format_data(datasource, schema, df, None, None, dtypes)
+        else:
+            cutoff = cached["end_date"].max() - lookback
+            schema, new = self.get_data_raw(
+                datasource, filters, aggregation, RowFilter(start_date=cutoff, equals=dimensions), columns,
+                dtypes=dtypes, decode_processes=decode_processes,
+            )
+            new = self._format_data(datasource, schema, new, cutoff, None, dtypes)
+            df = pandas.concat([cached[cached["end_date"] < cutoff], new], ignore_index=True, sort=False)
+
+        self._data_cache[key] = df
+        return df
+
+    @staticmethod
+    def _dimension_filters(companies, dimensions):
+        """
+        :return: (dict) rawdata filters for the companies and the ``dimensions`` argument of ``get_data``
+        :raises: ``DataMonsterError`` if ``dimensions`` filters on the companies too
+        """
+        dimensions = dimensions or {}
+        if "section_pk" in dimensions:
+            raise DataMonsterError("dimensions can not filter on section_pk: pass the companies instead")
+
+        filters = {"section_pk": [int(company.id) for company in companies]}
+        for split, values in dimensions.items():
+            filters[split] = list(values) if isinstance(values, (list, tuple, set, frozenset)) else [values]
+        return filters
+
+    @staticmethod
+    def _data_columns(splits):
+        """
+        :param splits: list of the split columns to keep, or None to keep all columns
+        :return: ``columns`` argument to ``get_data_raw`` keeping the columns ``get_data`` needs and ``splits``
+        """
+        if splits is None:
+            return None
+        splits = list(splits)
+
+        def columns(structure):
+            keep = ("lower_date", "upper_date", "value")
+            return [col for key in keep for col in structure.get(key, [])] + splits
+        return columns
+
+    def clear_data_cache(self):
+        """Release the data held for ``get_data(..., incremental=True)``"""
+        self._data_cache = {}
+
+    def get_coverage(self, datasource, filters=None):
+        """Get the companies and dates covered by the data source, from its dimension metadata
+
+        The metadata is fetched once and reused for ``coverage_max_age`` seconds.
+
+        :param datasource: ``Datasource`` object
+        :param filters: Optional dict of split column => values, see ``get_dimensions_for_datasource``
+
+        :return: ``CoveragePlanner``
+        """
+        self._check_param(datasource=datasource)
+        key = (datasource.id, json.dumps(filters or {}, sort_keys=True, default=str))
+        cached = self._coverage_cache.get(key)
+        if cached is not None and time.time() - cached[0] <= self.coverage_max_age:
+            return cached[1]
+
+        planner = CoveragePlanner(self.get_dimensions_for_datasource(datasource, filters or None))
+        self._coverage_cache[key] = (time.time(), planner)
+        return planner
+
+    def get_data_aggregations(self, datasource, company, periods, start_date=None, end_date=None):
+        """Get data for data source aggregated into several periods, with a single request
+
+        The daily data is fetched once and aggregated locally into each period, using the data
+        source's ``aggregationType``. See ``Aggregation.aggregate`` for how periods are defined.
+
+        :param datasource: ``Datasource`` object to get the data for
+        :param company: ``Company`` object to filter the data source on, and whose fiscal quarters are used
+        :param periods: (list of str) aggregation periods, any of "week", "month", "quarter", "fiscalQuarter"
+        :param start_date: Optional filter for the start date of the data
+        :param end_date: Optional filter for the end date of the data
+
+        :return: (dict) period => pandas.DataFrame, in the format returned by ``get_data``
+        """
+        self._check_param(company=company, datasource=datasource)
+        self._check_date_params(datasource, start_date, end_date)
+        aggregations = [Aggregation(period, company) for period in periods]
+
+        schema, df = self.get_data_raw(datasource, {"section_pk": [int(company.id)]})
+        return {
+            aggregation.period: self._format_data(
+                datasource, schema, aggregation.aggregate(schema, df, datasource.aggregationType),
+                start_date, end_date
+            )
+            for aggregation in aggregations
+        }
+
+    def get_panel(
+        self, datasource, companies, aggregation=None, start_date=None, end_date=None, dimensions=None, splits=None,
+        sparse=False
+    ):
+        """Get data for many companies as a panel: one row per date and one column per company
+
+        The panel is built straight from the decoded date, company and value columns, without the
+        ``dimensions`` dicts of ``get_data``, and the response is decoded in chunks while it is read.
+
+        :param datasource: ``Datasource`` object to get the data for
+        :param companies: list of ``Company`` objects, one column each
+        :param aggregation: Optional ``Aggregation`` object to specify the aggregation of the data
+        :param start_date: Optional filter for the start date of the data
+        :param end_date: Optional filter for the end date of the data
+        :param dimensions: Optional dict of split column => value, or list of values, to keep, see ``get_data``
+        :param splits: Optional list of split columns. Each combination of their values gets a column of its own
+            for each company, under ``(section_pk, *splits)`` MultiIndex columns. Without them, each company
+            must have a single value per date: use ``dimensions`` to select it
+        :param sparse: Optional bool. If ``True``, the columns are sparse, holding only the dates that have a
+            value. Saves memory for large universes, where most companies only cover some of the dates
+
+        :return: pandas.DataFrame indexed by ``end_date``, with a column per ``section_pk``, with NaN where
+            a company has no value
+        :raises: ``DataMonsterError`` if a company has several values for a date in the same column, or if
+            aggregating by the fiscal quarters of another company
+        """
+        splits = list(splits or [])
+        df = self._get_company_values(datasource, companies, aggregation, start_date, end_date, dimensions, splits)
+        return self._pivot_panel(df["end_date"], df["value"], df[["section_pk"] + splits], sparse)
+
+    def _get_company_values(self, datasource, companies, aggregation, start_date, end_date, dimensions, splits=()):
+        """Get the dates, company and value of each row of the data, keeping no other column
+
+        :return: pandas.DataFrame with columns ``section_pk``, ``start_date``, ``end_date``, ``time_span`` and
+            ``value`` as in ``get_data``, and ``splits``
+        """
+        self._check_param(datasource=datasource)
+        for company in companies:
+            self._check_param(company=company)
+        self._check_date_params(datasource, start_date, end_date)
+        splits = list(splits)
+
+        if aggregation is not None and aggregation.period == 'fiscalQuarter' and any(
+            aggregation.company != company for company in companies
+        ):
+            raise DataMonsterError("Aggregating by the fiscal quarter of a different company not yet supported")
+
+        filters = self._dimension_filters(companies, dimensions)
+
+        # The company of each row is decoded too, which the fields of some data sources leave out
+        fields = list(datasource.fields)
+        if "section_pk" not in [col["name"] for col in fields]:
+            fields.append({"name": "section_pk", "data_type": "number"})
+
+        def columns(structure):
+            keep = ("lower_date", "upper_date", "value", "section_pk")
+            return [col for key in keep for col in structure.get(key, [])] + splits
+
+        resp = self._post_rawdata(datasource, filters, aggregation)
+        schema, df = decode_avro_chunked(
+            self._response_stream(resp), fields, RowFilter(start_date, end_date, dimensions), columns
+        )
+        for key in ("lower_date", "upper_date", "value", "section_pk"):
+            if len(schema.get(key, [])) != 1:
+                raise DataMonsterError("DataMonster does not currently support this request")
+
+        df.rename(columns={schema["section_pk"][0]: "section_pk"}, inplace=True)
+        df.rename(columns=self._mapped_columns(self.DATAMONSTER_SCHEMA_FIELDS, schema), inplace=True)
+        df["section_pk"] = df["section_pk"].astype(int)
+        df["time_span"] = df["end_date"] - df["start_date"]
+        df["end_date"] -= datetime.timedelta(days=1)
+        return df[["section_pk", "start_date", "end_date", "time_span", "value"] + splits]
+
+    def get_aligned(
+        self, datasources, companies, start_date=None, end_date=None, dimensions=None, aggregation=None,
+        tolerance=None, max_workers=4
+    ):
+        """Get the data of several data sources for the same companies, aligned on the calendar of the first one
 
-        filters = {"section_pk": [int(company.id)]}
+        The data sources are fetched concurrently. Each row of the first data source gets, from each other data
+        source, the value for the same company whose period ends last on or before its ``end_date``, found with
+        a sorted merge (``pandas.merge_asof``). Data sources of the same cadence are thus matched period to
+        period, and the values of slower ones are carried forward.
+
+        :param datasources: list of ``Datasource`` objects, or dict of label => ``Datasource``. The first one
+            gives the calendar. The values of each are in a column named after its label, or else its name
+        :param companies: list of ``Company`` objects
+        :param start_date: Optional filter for the start date of the data
+        :param end_date: Optional filter for the end date of the data
+        :param dimensions: Optional dict of label => dimensions to keep for that data source, see ``get_data``.
+            Each data source must have a single value per company and date
+        :param aggregation: Optional ``Aggregation`` object, applied to all the data sources. Fiscal quarters can
+            only be those of the single company given
+        :param tolerance: Optional ``datetime.timedelta``. Values of the other data sources ending longer than
+            this before a row are not matched to it. Their data is fetched from this long before ``start_date``,
+            so that the first rows can be matched too
+        :param max_workers: (optional, int) number of data sources to fetch concurrently
+
+        :return: pandas.DataFrame with the ``section_pk``, ``start_date``, ``end_date`` and ``time_span`` of the
+            rows of the first data source, a value column per data source, and for each of the others,
+            a ``<label>_end_date`` column with the ``end_date`` of the period matched. NaN where none was matched
+        :raises: ``DataMonsterError`` if labels are repeated, a data source has several values for a company and
+            date, or if aggregating by the fiscal quarters of another company
+        """
+        if isinstance(datasources, dict):
+            labels, datasources = list(datasources.keys()), list(datasources.values())
+        else:
+            labels = [datasource.name for datasource in datasources]
+        if not datasources:
+            raise DataMonsterError("At least one data source is required")
+        reserved = {"section_pk", "start_date", "end_date", "time_span"}
+        names = labels + ["{}_end_date".format(label) for label in labels[1:]]
+        if len(set(names)) != len(names) or reserved.intersection(names):
+            raise DataMonsterError("Data sources must have distinct labels. Got {!r}".format(labels))
+
+        dimensions = dimensions or {}
+        other_start_date = start_date
+        if start_date is not None and tolerance is not None:
+            other_start_date = pandas.Timestamp(start_date) - tolerance
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self._get_company_values, datasource, companies, aggregation,
+                    start_date if i == 0 else other_start_date, end_date, dimensions.get(label),
+                )
+                for i, (label, datasource) in enumerate(zip(labels, datasources))
+            ]
+            frames = [future.result() for future in futures]
+
+        for label, df in zip(labels, frames):
+            if df.duplicated(["section_pk", "end_date"]).any():
+                raise DataMonsterError(
+                    "Several values for the same company and date in {!r}: select a single one with "
+                    "dimensions".format(label)
+                )
+
+        aligned = frames[0].rename(columns={"value": labels[0]}).sort_values("end_date", kind="mergesort")
+        for label, df in zip(labels[1:], frames[1:]):
+            other = df[["section_pk", "end_date", "value"]].rename(columns={"value": label})
+            other["{}_end_date".format(label)] = other["end_date"]
+            aligned = pandas.merge_asof(
+                aligned, other.sort_values("end_date", kind="mergesort"), on="end_date", by="section_pk",
+                tolerance=None if tolerance is None else pandas.Timedelta(tolerance), direction="backward",
+            )
+        return aligned.sort_values(["section_pk", "end_date"], kind="mergesort").reset_index(drop=True)
+
+    @staticmethod
+    def _group_keys(keys):
+        """Number the distinct rows of ``keys``, in sorted order, missing values sorting last
 
+        :param keys: pandas.DataFrame
+        :return: (numpy array, pandas.Index) the number of the distinct row of each row, and the distinct rows,
+            as a MultiIndex if ``keys`` has several columns
+        """
+        codes, levels = [], []
+        for col in keys.columns:
+            col_codes, uniques = pandas.factorize(keys[col], sort=True)
+            codes.append(numpy.where(col_codes == -1, len(uniques), col_codes))
+            levels.append(uniques)
+
+        grouped = pandas.Series(numpy.arange(len(keys))).groupby(codes, sort=True)
+        column_codes = grouped.ngroup().to_numpy()
+        distinct = grouped.size().index
+        values = []
+        for i, level in enumerate(levels):
+            level_codes = distinct.get_level_values(i).to_numpy()
+            missing = level_codes == len(level)
+            if missing.any():
+                values.append(level.take(numpy.where(missing, -1, level_codes), allow_fill=True, fill_value=numpy.nan))
+            else:
+                values.append(level.take(level_codes))
+        if len(values) == 1:
+            return column_codes, values[0].rename(keys.columns[0])
+        return column_codes, pandas.MultiIndex.from_arrays(values, names=list(keys.columns))
+
+    @staticmethod
+    def _pivot_panel(end_dates, values, keys, sparse):
+        """Pivot long data into a panel, with one row per end date and one column per combination of ``keys``
+
+        :param end_dates: pandas.Series of the end date of each row
+        :param values: pandas.Series of the value of each row
+        :param keys: pandas.DataFrame of the ``section_pk`` and splits of each row
+        :param sparse: (bool) whether to make sparse columns
+
+        :return: pandas.DataFrame
+        """
+        row_codes, dates = pandas.factorize(end_dates, sort=True)
+        index = pandas.DatetimeIndex(dates, name="end_date")
+        if keys.empty:
+            return pandas.DataFrame(index=index, columns=pandas.Index([], name="section_pk"), dtype=float)
+
+        column_codes, columns = DataMonster._group_keys(keys)
+
+        cells = column_codes.astype(numpy.int64) * len(index) + row_codes
+        if len(numpy.unique(cells)) != len(cells):
+            raise DataMonsterError(
+                "Several values for the same date and column: select a single one with dimensions, "
+                "or give the splits to keep apart"
+            )
+
+        values = values.to_numpy(dtype=float)
+        if not sparse:
+            panel = numpy.full((len(index), len(columns)), numpy.nan)
+            panel[row_codes, column_codes] = values
+            return pandas.DataFrame(panel, index=index, columns=columns)
+
+        # One dense column at a time, so that the panel is never held dense
+        order = numpy.argsort(column_codes, kind="stable")
+        bounds = numpy.searchsorted(column_codes[order], numpy.arange(len(columns) + 1))
+        data = {}
+        for i in range(len(columns)):
+            rows = order[bounds[i]:bounds[i + 1]]
+            column = numpy.full(len(index), numpy.nan)
+            column[row_codes[rows]] = values[rows]
+            data[i] = pandas.arrays.SparseArray(column)
+        panel = pandas.DataFrame(data, index=index)
+        panel.columns = columns
+        return panel
+
+    @staticmethod
+    def _check_date_params(datasource, start_date, end_date):
         if start_date is not None:
             if not datasource.upperDateField:
                 raise DataMonsterError("This data source does not support date queries")
@@ -264,16 +757,69 @@ class DataMonster(object):
             if not datasource.lowerDateField:
                 raise DataMonsterError("This data source does not support date queries")
 
-        if aggregation is not None and aggregation.period == 'fiscalQuarter' and aggregation.company != company:
-            raise DataMonsterError("Aggregating by the fiscal quarter of a different company not yet supported")
+    def _format_data(self, datasource, schema, df, start_date, end_date, dtypes=None):
+        """Turn raw data into the format returned by ``get_data``"""
+        if datasource.type == "datasource":
+            df = self._datamonster_data_mapper(
+                self.DATAMONSTER_SCHEMA_FIELDS, schema, df, dtypes is not None and dtypes.intern_dimensions
+            )
 
-        schema, df = self.get_data_raw(datasource, filters, aggregation)
+        df = self._trim_dates(df, start_date, end_date)
+        if "end_date" in df:
+            df.sort_values(by="end_date", inplace=True)
+        return df
 
+    def _format_arrow_data(self, datasource, schema, table, start_date, end_date):
+        """Turn raw data read into a ``pyarrow.Table`` into the format returned by ``get_data``"""
         if datasource.type == "datasource":
-            df = self._datamonster_data_mapper(
-                self.DATAMONSTER_SCHEMA_FIELDS, schema, df
+            table = self._datamonster_arrow_mapper(self.DATAMONSTER_SCHEMA_FIELDS, schema, table)
+
+        table = self._trim_arrow_dates(table, start_date, end_date)
+        if "end_date" in table.column_names:
+            table = table.sort_by("end_date")
+        return table
+
+    @staticmethod
+    def _trim_arrow_dates(table, start_date, end_date):
+        """``_trim_dates`` for a ``pyarrow.Table``"""
+        import pyarrow
+        import pyarrow.compute
+
+        names = table.column_names
+        if start_date is not None and "end_date" in names:
+            start = pyarrow.scalar(pandas.Timestamp(start_date), pyarrow.timestamp("ns"))
+            table = table.filter(pyarrow.compute.greater_equal(table["end_date"], start))
+        if end_date is not None and "start_date" in names:
+            end = pyarrow.scalar(pandas.Timestamp(end_date), pyarrow.timestamp("ns"))
+            table = table.filter(pyarrow.compute.less_equal(table["start_date"], end))
+        return table
+
+    @staticmethod
+    def _check_output(output):
+        if output not in ("pandas", "arrow"):
+            raise DataMonsterError("output must be 'pandas' or 'arrow'. Got {!r}".format(output))
+
+    @staticmethod
+    def _check_dtypes(dtypes, output):
+        if dtypes is not None and output != "pandas":
+            raise DataMonsterError("dtypes only applies to pandas output")
+
+    @staticmethod
+    def _check_decode_processes(decode_processes, output):
+        if decode_processes and output != "pandas":
+            raise DataMonsterError("decode_processes only applies to pandas output")
+
+    @staticmethod
+    def _check_strategy(strategy, output):
+        if strategy not in ("buffered", "streamed", "sharded", "auto"):
+            raise DataMonsterError(
+                "strategy must be 'buffered', 'streamed', 'sharded' or 'auto'. Got {!r}".format(strategy)
             )
+        if strategy == "sharded" and output != "pandas":
+            raise DataMonsterError("Sharded fetches only apply to pandas output")
 
+    @staticmethod
+    def _trim_dates(df, start_date, end_date):
         # Trim the dates on the client side. This would be more efficient on the server, but we don't support
         # greater than or less than right now
         if start_date is not None and 'end_date' in df:
@@ -281,21 +827,527 @@ class DataMonster(object):
 
         if end_date is not None and 'start_date' in df:
             df = df[df.start_date <= pandas.Timestamp(end_date)]
-
-        if "end_date" in df:
-            df.sort_values(by="end_date", inplace=True)
         return df
 
-    def get_data_raw(self, datasource, filters=None, aggregation=None):
+    def get_data_raw(
+        self, datasource, filters=None, aggregation=None, row_filter=None, columns=None, output="pandas",
+        dtypes=None, decode_processes=None, strategy="buffered", limit=None
+    ):
         """Get raw data for all companies available in the data source.
 
         :param datasource: ``Datasource`` object to get the data for
         :param aggregation: ``Aggregation`` object to specify requested aggregation
         :param filters: dictionary of requested filters
+        :param row_filter: Optional ``RowFilter``, applied to the rows while they are decoded
+        :param columns: Optional list of the fields to keep. The other fields are dropped from each record as
+            it is read, and never put in the DataFrame
+        :param output: ``"pandas"`` (default) or ``"arrow"`` to decode straight into a ``pyarrow.Table``,
+            with dictionary encoded string columns. Requires pyarrow
+        :param dtypes: Optional ``DtypePolicy``, to store the data in less memory. pandas output only
+        :param decode_processes: Optional number of processes to decode the data with. The avro data is
+            made of independent blocks, which are split between the processes. Worth it for large data
+            only, e.g. whole data source pulls. pandas output and buffered fetches only, including when
+            ``strategy="auto"`` picks a buffered fetch
+        :param strategy: how to fetch the data. ``"buffered"`` (default) reads the whole response, then decodes
+            it: the fastest for small data. ``"streamed"`` decodes the response in chunks while it is read,
+            without ever holding all of it. ``"sharded"`` splits the companies into requests fetched
+            concurrently, as in ``get_data_raw_sharded``, pandas output only. ``"auto"`` picks one of them,
+            see ``fetch_strategy``
+        :param limit: Optional number of rows to get, e.g. to preview the data. The response is decoded while
+            it is read, and closed once ``limit`` rows are decoded, without reading the rest of it. The rows
+            are the first of the response, in the order the server sends them. Not combined with
+            ``decode_processes`` or sharded fetches
+
+        :return: (schema, pandas.DataFrame), or (schema, pyarrow.Table)
+
+        See `here <examples.html#get-data-raw>`__ for example usage.
+        """
+        self._check_output(output)
+        self._check_dtypes(dtypes, output)
+        self._check_decode_processes(decode_processes, output)
+        self._check_strategy(strategy, output)
+        if limit is not None:
+            return self._get_data_raw_head(
+                datasource, filters, aggregation, row_filter, columns, output, dtypes, decode_processes, strategy,
+                limit,
+            )
+        if strategy == "auto":
+            strategy = self.fetch_strategy(datasource, filters, aggregation, output)
+        if decode_processes and strategy != "buffered":
+            raise DataMonsterError(
+                "decode_processes only applies to buffered fetches, not {} ones".format(strategy)
+            )
+
+        if strategy == "sharded":
+            schema, df = self.get_data_raw_sharded(
+                datasource, filters, aggregation, row_filter=row_filter, columns=columns, dtypes=dtypes,
+                shard_rows=self.auto_shard_rows,
+            )
+        elif strategy == "streamed":
+            resp = self._post_rawdata(datasource, filters, aggregation)
+            schema, df = decode_avro_chunked(
+                self._response_stream(resp), datasource.fields, row_filter, columns, output=output, dtypes=dtypes
+            )
+        elif output == "arrow":
+            resp = self._post_rawdata(datasource, filters, aggregation)
+            schema, df = decode_avro_arrow(six.BytesIO(resp.content), datasource.fields, row_filter, columns)
+        else:
+            resp = self._post_rawdata(datasource, filters, aggregation)
+            schema, df = self._avro_to_df(resp.content, datasource.fields, row_filter, columns, decode_processes)
+            if dtypes is not None:
+                dtypes.apply(df)
+
+        if not row_filter:
+            self._row_history[self._fetch_key(datasource, filters, aggregation)] = len(df)
+        return schema, df
+
+    def _get_data_raw_head(
+        self, datasource, filters, aggregation, row_filter, columns, output, dtypes, decode_processes, strategy, limit
+    ):
+        """Get the first ``limit`` rows of the raw data, closing the response once they are decoded
+
+        :return: (schema, pandas.DataFrame), or (schema, pyarrow.Table)
+        """
+        if limit < 0:
+            raise DataMonsterError("limit must be positive. Got {!r}".format(limit))
+        if decode_processes or strategy == "sharded":
+            raise DataMonsterError("limit can not be combined with decode_processes or sharded fetches")
+
+        resp = self._post_rawdata(datasource, filters, aggregation)
+        try:
+            return decode_avro_chunked(
+                self._response_stream(resp), datasource.fields, row_filter, columns, output=output, dtypes=dtypes,
+                limit=limit,
+            )
+        finally:
+            # Drops the connection rather than reading the rest of the response
+            if hasattr(resp, "close"):
+                resp.close()
+
+    def fetch_strategy(self, datasource, filters=None, aggregation=None, output="pandas"):
+        """Pick how ``get_data_raw(..., strategy="auto")`` fetches the data, from the number of rows expected
+
+        Up to ``buffered_max_rows`` rows, the response is read whole. From ``sharded_min_rows`` rows, the request
+        is split into shards of companies, unless it is for a single company or Arrow output. Otherwise, and
+        when the number of rows can not be estimated, the response is decoded while it is read.
+
+        :param datasource: ``Datasource`` object
+        :param filters: Optional dictionary of requested filters
+        :param aggregation: Optional ``Aggregation`` object
+        :param output: ``"pandas"`` or ``"arrow"``
+
+        :return: (str) ``"buffered"``, ``"streamed"`` or ``"sharded"``
+        """
+        rows = self.estimate_rows(datasource, filters, aggregation)
+        if rows is None:
+            return "streamed"
+        if rows <= self.buffered_max_rows:
+            return "buffered"
+        section_pks = (filters or {}).get("section_pk")
+        if rows >= self.sharded_min_rows and output == "pandas" and (section_pks is None or len(section_pks) > 1):
+            return "sharded"
+        return "streamed"
+
+    def estimate_rows(self, datasource, filters=None, aggregation=None):
+        """Estimate the number of rows of a request for raw data
+
+        The estimate is the ``row_count`` of the dimensions of the data source matching ``filters``, which
+        does not take ``aggregation`` into account, read from the first page of the dimensions and reused for
+        ``coverage_max_age`` seconds. When it can not be had, it is the number of rows last fetched by
+        ``get_data_raw`` for the same request, without a ``row_filter``.
+
+        :param datasource: ``Datasource`` object
+        :param filters: Optional dictionary of requested filters
+        :param aggregation: Optional ``Aggregation`` object
+
+        :return: (int) number of rows, or ``None`` if it can not be estimated
+        """
+        key = (datasource.id, json.dumps(filters or {}, sort_keys=True, default=str))
+        cached = self._row_count_cache.get(key)
+        if cached is not None and time.time() - cached[0] <= self.coverage_max_age:
+            return cached[1]
+
+        try:
+            row_count = self.get_dimensions_for_datasource(datasource, filters or None).row_count
+        except (DataMonsterError, requests.RequestException):
+            return self._row_history.get(self._fetch_key(datasource, filters, aggregation))
+        self._row_count_cache[key] = (time.time(), row_count)
+        return row_count
+
+    @staticmethod
+    def _fetch_key(datasource, filters, aggregation):
+        return (
+            datasource.id,
+            json.dumps(filters or {}, sort_keys=True, default=str),
+            None if aggregation is None else json.dumps(
+                aggregation.to_time_aggregation_dictionary(), sort_keys=True, default=str
+            ),
+        )
+
+    def get_data_raw_bytes(self, datasource, filters=None, aggregation=None, dest=None):
+        """Write the raw data of the data source, as the avro file sent by the server, without decoding it
+
+        The response is copied to ``dest`` while it is read, so that it is never held in memory. The file
+        embeds its schema, with the ``structure`` returned by ``get_data_raw``, and can be read by any avro reader.
+
+        :param datasource: ``Datasource`` object to get the data for
+        :param filters: Optional dictionary of requested filters
+        :param aggregation: Optional ``Aggregation`` object to specify requested aggregation
+        :param dest: (str) path of the file to write, which only appears once the whole response is written, or
+            writable binary file-like object. ``None`` returns the data as bytes
+
+        :return: (int) number of bytes written, or (bytes) the data if ``dest`` is ``None``
+        """
+        self._check_param(datasource=datasource)
+        if dest is None:
+            buffer = six.BytesIO()
+            self.get_data_raw_bytes(datasource, filters, aggregation, buffer)
+            return buffer.getvalue()
+
+        if isinstance(dest, six.string_types):
+            tmp_path = "{}.{}.tmp".format(dest, os.getpid())
+            try:
+                with open(tmp_path, "wb") as fp:
+                    size = self.get_data_raw_bytes(datasource, filters, aggregation, fp)
+                os.replace(tmp_path, dest)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return size
+
+        resp = self._post_rawdata(datasource, filters, aggregation)
+        try:
+            stream = self._response_stream(resp)
+            size = 0
+            while True:
+                chunk = stream.read(self.raw_bytes_chunk_size)
+                if not chunk:
+                    return size
+                dest.write(chunk)
+                size += len(chunk)
+        finally:
+            if hasattr(resp, "close"):
+                resp.close()
+
+    def get_data_raw_sharded(
+        self, datasource, filters=None, aggregation=None, shard_size=50, max_workers=4, retries=2,
+        row_filter=None, columns=None, dtypes=None, shard_rows=None
+    ):
+        """Get raw data for many companies of the data source, in shards fetched concurrently
+
+        Takes the same arguments as ``iter_data_raw_shards``, and concatenates the shards.
 
         :return: (schema, pandas.DataFrame)
+        """
+        schema, frames = {}, []
+        for _, schema, df in self.iter_data_raw_shards(
+            datasource, filters, aggregation, shard_size, max_workers, retries, row_filter, columns, dtypes,
+            shard_rows=shard_rows,
+        ):
+            frames.append(df)
+
+        if not frames:
+            return schema, pandas.DataFrame(columns=[col["name"] for col in datasource.fields])
+        return schema, concat_frames(frames)
+
+    def iter_data_raw_shards(
+        self, datasource, filters=None, aggregation=None, shard_size=50, max_workers=4, retries=2,
+        row_filter=None, columns=None, dtypes=None, checkpoint=None, shard_rows=None
+    ):
+        """Get raw data for many companies of the data source, in shards fetched concurrently
 
-        See `here <examples.html#get-data-raw>`__ for example usage.
+        The companies of the ``section_pk`` filter, or all the companies covered by the data source if
+        there is none, are split into shards of ``shard_size`` companies. Each shard is a request of
+        its own, so that no single response holds the whole data source. A shard that fails is retried up
+        to ``retries`` times, with the other shards carrying on. At most ``max_workers`` shards are
+        fetched at the same time, and no more are fetched until the ones done have been consumed.
+
+        With ``shard_rows``, shards are instead planned from the dimension metadata of the data source,
+        see ``get_coverage``: companies without rows matching the dates of ``row_filter`` are skipped,
+        and the others are grouped into shards of about ``shard_rows`` rows, of at most ``shard_size``
+        companies.
+
+        :param datasource: ``Datasource`` object to get the data for
+        :param filters: Optional dictionary of requested filters
+        :param aggregation: Optional ``Aggregation`` object to specify requested aggregation
+        :param shard_size: (optional, int) number of companies in each shard
+        :param max_workers: (optional, int) number of shards to fetch concurrently
+        :param retries: (optional, int) number of times to retry a failed shard
+        :param row_filter: Optional ``RowFilter``, see ``get_data_raw``
+        :param columns: Optional list of the fields to keep, see ``get_data_raw``
+        :param dtypes: Optional ``DtypePolicy``, see ``get_data_raw``
+        :param checkpoint: Optional ``CheckpointJournal``, or path of its file, recording the shards done, which
+            are skipped. A shard is recorded once the next one is requested, i.e. once it has been consumed.
+            The shards planned by the first run are recorded too, and used by the next runs
+        :param shard_rows: (optional, int) number of rows expected in each shard, at most
+
+        :return: iterator of (list of int, schema, pandas.DataFrame): the ``section_pk`` of the companies
+            in each shard, and its data, in the order the shards are done
+        :raises: ``DataMonsterError`` or the error of the request if a shard still fails after its retries
+        """
+        self._check_param(datasource=datasource)
+        filters = dict(filters or {})
+        checkpoint = self._checkpoint_journal(checkpoint)
+        job = self._shard_job("pull", datasource, filters, aggregation, row_filter, columns)
+        shards = self._shard_plan(checkpoint, job, datasource, filters, shard_size, shard_rows, row_filter)
+        units = [dict(job, section_pk=shard) for shard in shards]
+        shards = iter([
+            (shard, unit) for shard, unit in zip(shards, units) if checkpoint is None or not checkpoint.is_done(unit)
+        ])
+
+        def fetch(shard, unit):
+            schema, df = self._with_retries(
+                retries, self.get_data_raw, datasource, dict(filters, section_pk=shard), aggregation, row_filter,
+                columns, dtypes=dtypes,
+            )
+            return unit, (shard, schema, df)
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            pending = set(executor.submit(fetch, *shard) for shard in itertools.islice(shards, max_workers))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit, result = future.result()
+                    for shard in itertools.islice(shards, 1):
+                        pending.add(executor.submit(fetch, *shard))
+                    yield result
+                    if checkpoint is not None:
+                        checkpoint.mark_done(unit)
+
+    def export_datasource(
+        self, datasource, path, partition_by=None, filters=None, aggregation=None, shard_size=50, max_workers=4,
+        retries=2, chunk_size=100000, max_pending=8, row_filter=None, columns=None, checkpoint=None,
+        shard_rows=None
+    ):
+        """Write the raw data of the data source to a Parquet dataset on disk, chunk by chunk
+
+        The data is fetched in shards of companies, as in ``iter_data_raw_shards``, and each response is
+        decoded into Arrow chunks of ``chunk_size`` rows while it is read. The chunks are handed to the
+        Parquet writer through a queue of at most ``max_pending`` chunks: when writing falls behind,
+        decoding waits. Memory use is thus bounded by about ``max_workers + max_pending`` chunks,
+        whatever the size of the data source. Requires pyarrow.
+
+        Failed requests are retried as in ``iter_data_raw_shards``, but a response failing while it is
+        read fails the export. With a ``checkpoint``, running the same export again then only exports
+        the shards that were not done, replacing any files they had written.
+
+        :param datasource: ``Datasource`` object to export
+        :param path: (str) directory to write the dataset to. Files already there are kept, except those
+            written by an earlier export of the same shards
+        :param partition_by: Optional list of columns to partition the dataset by, in ``column=value``
+            directories, e.g. ``['section_pk']``
+        :param filters: Optional dictionary of requested filters
+        :param aggregation: Optional ``Aggregation`` object to specify requested aggregation
+        :param shard_size: (optional, int) number of companies in each request
+        :param max_workers: (optional, int) number of requests to run concurrently
+        :param retries: (optional, int) number of times to retry a failed request
+        :param chunk_size: (optional, int) maximum number of rows in each chunk, and Parquet file
+        :param max_pending: (optional, int) maximum number of chunks waiting to be written
+        :param row_filter: Optional ``RowFilter``, see ``get_data_raw``
+        :param columns: Optional list of the fields to keep, see ``get_data_raw``
+        :param checkpoint: Optional ``CheckpointJournal``, or path of its file, recording the shards written,
+            which are skipped, as in ``iter_data_raw_shards``. A shard is recorded once its files are synced to disk
+        :param shard_rows: (optional, int) number of rows expected in each request, see ``iter_data_raw_shards``
+
+        :return: (dict) with keys ``shards``, ``chunks`` and ``rows``, the numbers written, and ``skipped``,
+            the number of shards skipped as done already
+        """
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise DataMonsterError('pyarrow is required to write Parquet files')
+
+        self._check_param(datasource=datasource)
+        filters = dict(filters or {})
+        checkpoint = self._checkpoint_journal(checkpoint)
+        job = self._shard_job(
+            "export", datasource, filters, aggregation, row_filter, columns, os.path.abspath(path), partition_by
+        )
+        shards = self._shard_plan(checkpoint, job, datasource, filters, shard_size, shard_rows, row_filter)
+        units = [dict(job, section_pk=shard) for shard in shards]
+        stats = {"shards": 0, "chunks": 0, "rows": 0, "skipped": 0}
+        if checkpoint is not None:
+            stats["skipped"] = sum(checkpoint.is_done(unit) for unit in units)
+            pending = [i for i, unit in enumerate(units) if not checkpoint.is_done(unit)]
+            shards, units = [shards[i] for i in pending], [units[i] for i in pending]
+
+        # Files are named after their shard, so that those left by an export that failed can be replaced
+        file_prefixes = ["part-{}-".format(CheckpointJournal.unit_key(unit)[:16]) for unit in units]
+        self._remove_files(path, file_prefixes)
+
+        chunks = six.moves.queue.Queue(max_pending)
+        stop = threading.Event()
+
+        def put(item):
+            """Queue ``item``, unless the export stops while waiting for room"""
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except six.moves.queue.Full:
+                    pass
+            return False
+
+        def fetch(index, shard):
+            # Queues (index, number, table) for each chunk, then (index, None, None) once done or
+            # (index, None, error) if failed
+            if stop.is_set():
+                return
+            try:
+                resp = self._with_retries(
+                    retries, self._post_rawdata, datasource, dict(filters, section_pk=shard), aggregation
+                )
+                _, tables = iter_decode_avro(
+                    self._response_stream(resp), datasource.fields, row_filter, columns, chunk_size, "arrow"
+                )
+                for number, table in enumerate(tables):
+                    if not put((index, number, table)):
+                        return
+            except Exception as e:
+                put((index, None, e))
+            else:
+                put((index, None, None))
+
+        written = [[] for _ in shards]
+        executor = ThreadPoolExecutor(max_workers)
+        try:
+            for index, shard in enumerate(shards):
+                executor.submit(fetch, index, shard)
+
+            while stats["shards"] < len(shards):
+                index, number, table = chunks.get()
+                if number is None:
+                    if table is not None:
+                        raise table
+                    if checkpoint is not None:
+                        self._fsync_files(written[index])
+                        checkpoint.mark_done(units[index])
+                    stats["shards"] += 1
+                    continue
+
+                pq.write_to_dataset(
+                    table, path, partition_cols=partition_by or None,
+                    basename_template="{}{}-{{i}}.parquet".format(file_prefixes[index], number),
+                    existing_data_behavior="overwrite_or_ignore",
+                    file_visitor=lambda written_file, index=index: written[index].append(written_file.path),
+                )
+                stats["chunks"] += 1
+                stats["rows"] += table.num_rows
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+
+        return stats
+
+    @staticmethod
+    def _checkpoint_journal(checkpoint):
+        if checkpoint is None or isinstance(checkpoint, CheckpointJournal):
+            return checkpoint
+        return CheckpointJournal(checkpoint)
+
+    @staticmethod
+    def _shard_job(kind, datasource, filters, aggregation, row_filter, columns, path=None, partition_by=None):
+        """
+        :param kind: (str) ``"pull"`` or ``"export"``
+        :return: (dict) description of a sharded job, as a ``CheckpointJournal`` job. The unit of each
+            shard is the job with the ``section_pk`` of the shard
+        """
+        return {
+            "job": kind,
+            "datasource": datasource.id,
+            "filters": filters,
+            "aggregation": None if aggregation is None else aggregation.to_time_aggregation_dictionary(),
+            "start_date": None if row_filter is None else row_filter.start_date,
+            "end_date": None if row_filter is None else row_filter.end_date,
+            "equals": None if row_filter is None else row_filter.equals,
+            "columns": columns,
+            "path": path,
+            "partition_by": partition_by,
+        }
+
+    def _shard_plan(self, checkpoint, job, datasource, filters, shard_size, shard_rows, row_filter):
+        """
+        :return: list of list of int, the shards of ``_section_pk_shards``, or those recorded in ``checkpoint`` by
+            the first run of the job, so that the shards stay the same when the companies or their coverage change
+        """
+        def create():
+            return self._section_pk_shards(datasource, filters, shard_size, shard_rows, row_filter)
+
+        if checkpoint is None:
+            return create()
+        return checkpoint.plan(job, create)
+
+    @staticmethod
+    def _fsync_files(paths):
+        """Sync the files, and the directories holding them, to disk"""
+        for path in list(paths) + sorted(set(os.path.dirname(path) for path in paths)):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _remove_files(path, prefixes):
+        """Remove the files under ``path`` whose name starts with any of ``prefixes``"""
+        if not prefixes or not os.path.isdir(path):
+            return
+        prefixes = tuple(prefixes)
+        for directory, _, names in os.walk(path):
+            for name in names:
+                if name.startswith(prefixes):
+                    os.remove(os.path.join(directory, name))
+
+    @staticmethod
+    def _response_stream(resp):
+        """
+        :return: file-like object reading the body of a streamed response as it arrives. Responses without
+            a raw stream, e.g. already read, are read from their content
+        """
+        raw = getattr(resp, "raw", None)
+        if raw is None:
+            return six.BytesIO(resp.content)
+        raw.decode_content = True
+        return raw
+
+    def _section_pk_shards(self, datasource, filters, shard_size, shard_rows=None, row_filter=None):
+        """Split the companies of the ``section_pk`` filter, or else all the companies covered by the data source
+
+        :return: list of list of int, shards of at most ``shard_size`` section_pks, and about ``shard_rows``
+            rows matching the dates of ``row_filter`` if given
+        """
+        if "section_pk" in filters:
+            section_pks = [int(pk) for pk in filters["section_pk"]]
+        else:
+            section_pks = sorted(int(company.pk) for company in self.get_companies(datasource=datasource))
+
+        if shard_rows is not None:
+            planner = self.get_coverage(
+                datasource, {key: value for key, value in filters.items() if key != "section_pk"}
+            )
+            return planner.batches(
+                section_pks, shard_rows, shard_size,
+                None if row_filter is None else row_filter.start_date,
+                None if row_filter is None else row_filter.end_date,
+            )
+        return [section_pks[i:i + shard_size] for i in range(0, len(section_pks), shard_size)]
+
+    def _with_retries(self, retries, func, *args, **kwargs):
+        """Call ``func``, again up to ``retries`` times if it fails with a request error, waiting
+        ``shard_retry_wait`` seconds, doubled on each retry
+        """
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except (DataMonsterError, requests.RequestException):
+                if attempt == retries:
+                    raise
+                time.sleep(self.shard_retry_wait * 2 ** attempt)
+
+    def _post_rawdata(self, datasource, filters=None, aggregation=None):
+        """Request raw data for the data source
+
+        :return: the streamed ``requests.Response`` holding the avro data
         """
         post_data = {
             'forecast': False,
@@ -312,57 +1364,99 @@ class DataMonster(object):
 
         headers = {"Accept": "avro/binary", 'Content-Type': 'application/json'}
         url = self.rawdata_path.format(datasource.id)
-        resp = self.client.post(url, post_data, headers, stream=True)
-        return self._avro_to_df(resp.content, datasource.fields)
+        return self.client.post(url, post_data, headers, stream=True)
 
     def get_raw_data(self, *args, **kwargs):
         """This function is deprecated. Please use the get_data_raw function instead"""
         raise DataMonsterError("This function has been deprecated. Please use get_data_raw")
 
-    def _avro_to_df(self, avro_buffer, data_types):
+    def _avro_to_df(self, avro_buffer, data_types, row_filter=None, columns=None, processes=None):
         """Read an avro structure into a dataframe and minimially parse it
 
         returns: (schema, pandas.Dataframe)
         """
-
-        def parse_row(row):
-            return {
-                col["name"]: pandas.to_datetime(row[col["name"]])
-                if col["data_type"] == "date"
-                else row[col["name"]]
-                for col in data_types
-            }
-
-        reader = fastavro.reader(six.BytesIO(avro_buffer))
-        metadata = reader.writer_schema.get("structure", ())
-
-        if not metadata:
-            raise DataMonsterError(
-                "DataMonster does not currently support this request"
-            )
-
-        records = [parse_row(r) for r in reader]
-        return metadata, pandas.DataFrame.from_records(records)
+        if processes:
+            return decode_avro_parallel(avro_buffer, data_types, processes, row_filter, columns)
+        return decode_avro(six.BytesIO(avro_buffer), data_types, row_filter, columns)
 
     @staticmethod
-    def _datamonster_data_mapper(mapping_fields, schema, df):
+    def _datamonster_data_mapper(mapping_fields, schema, df, intern_dimensions=False):
         """mapping function applied to a ``DataMonster`` data source to format the data
 
         :param mapping_fields (dict): mapping of column names to rename from in the schema
         :param schema (dict): avro schema of the data
         :param df (pandas.DataFrame): data to manipulate
+        :param intern_dimensions (bool): share a single ``dimensions`` dict between rows with the same splits
 
         :return: pandas.DataFrame
         """
         if df.empty:
             return df
 
+        split_columns = [col for col in schema.get("split", []) if col in df]
+        rename_columns = DataMonster._mapped_columns(mapping_fields, schema)
+
+        df.rename(columns=rename_columns, inplace=True)
+        if intern_dimensions:
+            df["dimensions"] = interned_dimensions(df, split_columns)
+        else:
+            df["dimensions"] = df.apply(
+                lambda row, *splits: {split: row[split] for split in splits},
+                args=(split_columns),
+                axis=1,
+            )
+
+        df["time_span"] = df["end_date"] - df["start_date"]
+        df["end_date"] -= datetime.timedelta(
+            days=1
+        )  # Change the format of the end_date
+        drop_columns = [col for col in split_columns + ["section_pk"] if col in df]
+        df.drop(columns=drop_columns, inplace=True)
+        return df
+
+    @staticmethod
+    def _datamonster_arrow_mapper(mapping_fields, schema, table):
+        """``_datamonster_data_mapper`` for data read into a ``pyarrow.Table``
+
+        :return: pyarrow.Table
+        """
+        import pyarrow
+        import pyarrow.compute
+
+        if table.num_rows == 0:
+            return table
+
+        names = table.column_names
+        split_columns = [col for col in schema.get("split", []) if col in names]
+        rename_columns = DataMonster._mapped_columns(mapping_fields, schema)
+        table = table.rename_columns([rename_columns.get(name, name) for name in names])
+
+        if split_columns:
+            dimensions = pyarrow.StructArray.from_arrays(
+                [table[split].combine_chunks() for split in split_columns], names=split_columns
+            )
+        else:
+            # a struct without fields can not be written to Parquet
+            dimensions = pyarrow.nulls(table.num_rows)
+        time_span = pyarrow.compute.subtract(table["end_date"], table["start_date"])
+        one_day = pyarrow.scalar(datetime.timedelta(days=1), pyarrow.duration("ns"))
+        end_date = pyarrow.compute.subtract(table["end_date"], one_day)
+
+        table = table.set_column(table.column_names.index("end_date"), "end_date", end_date)
+        table = table.append_column("dimensions", dimensions).append_column("time_span", time_span)
+        drop_columns = [col for col in split_columns + ["section_pk"] if col in table.column_names]
+        return table.drop(drop_columns)
+
+    @staticmethod
+    def _mapped_columns(mapping_fields, schema):
+        """
+        :return: (dict) names of the columns in the data => names given to them by ``mapping_fields``
+        """
         if not set(schema.keys()).issuperset(mapping_fields.keys()):
             raise DataMonsterError(
                 "DataMonster does not currently support this request"
             )
 
-        split_columns = schema.get("split", [])
         rename_columns = {}
         for key, val in mapping_fields.items():
             if len(schema[key]) != 1:
@@ -372,21 +1466,7 @@ class DataMonster(object):
                     )
                 )
             rename_columns[schema[key][0]] = val
-
-        df.rename(columns=rename_columns, inplace=True)
-        df["dimensions"] = df.apply(
-            lambda row, *splits: {split: row[split] for split in splits},
-            args=(split_columns),
-            axis=1,
-        )
-
-        df["time_span"] = df["end_date"] - df["start_date"]
-        df["end_date"] -= datetime.timedelta(
-            days=1
-        )  # Change the format of the end_date
-        drop_columns = [col for col in split_columns + ["section_pk"] if col in df]
-        df.drop(columns=drop_columns, inplace=True)
-        return df
+        return rename_columns
 
     def get_dimensions_for_datasource(
         self, datasource, filters=None, add_company_info_from_pks=False
@@ -499,6 +1579,111 @@ class DataMonster(object):
         dg = self.get_data_group_details(id)
         return self._data_group_result_to_object(dg, has_details=True)
 
+    def _get_upload_hashes(self):
+        """Map of data group id (as str) => content hash of the last successful upload, loaded on first use"""
+        if self._upload_hashes is None:
+            self._upload_hashes = {}
+            if self._upload_hash_path is not None and os.path.exists(self._upload_hash_path):
+                with open(self._upload_hash_path) as fp:
+                    self._upload_hashes = json.load(fp)
+        return self._upload_hashes
+
+    def _get_upload_hash(self, data_group_id):
+        with self._upload_hashes_lock:
+            return self._get_upload_hashes().get(str(data_group_id))
+
+    def _set_upload_hash(self, data_group_id, content_hash):
+        """Remember ``content_hash`` as the last upload to the data group, or forget it if ``None``"""
+        with self._upload_hashes_lock:
+            hashes = self._get_upload_hashes()
+            if content_hash is None:
+                if hashes.pop(str(data_group_id), None) is None:
+                    return
+            else:
+                hashes[str(data_group_id)] = content_hash
+
+            if self._upload_hash_path is not None:
+                tmp_path = '{}.tmp'.format(self._upload_hash_path)
+                with open(tmp_path, 'w') as fp:
+                    json.dump(hashes, fp)
+                os.replace(tmp_path, self._upload_hash_path)
+
+    def refresh_data_groups(self, data, max_workers=4, poll_interval=1, max_poll_interval=60, timeout=None,
+                            skip_unchanged=False, encode_processes=None, max_pending=None):
+        """Refresh several data groups at once and wait for all of them to finish processing
+
+        DataFrames are encoded and uploaded in a pipeline: while some payloads are uploading, the next
+        ones are being encoded, either in threads or, with ``encode_processes``, in a process pool.
+        At most ``max_workers`` uploads run at the same time, and at most ``max_pending`` encoded
+        payloads are held in memory. Every data group is polled as soon as its upload is done,
+        with the backoff described in
+        `DataGroup.wait_for_refresh <api.html#datamonster_api.DataGroup.wait_for_refresh>`__.
+
+        :param data: (dict) ``DataGroup`` => pandas.DataFrame to refresh it with
+        :param max_workers: (optional, int) number of uploads to run concurrently
+        :param poll_interval: (optional, float) seconds to wait before first polling a data group. Must be positive
+        :param max_poll_interval: (optional, float) longest wait between two polls of a data group, in seconds
+        :param timeout: (optional, float) stop polling a data group this many seconds after its upload
+        :param skip_unchanged: (optional, bool) skip data groups whose DataFrame is the same as their
+            last successful upload. See ``DataGroup.start_data_refresh``
+        :param encode_processes: (optional, int) number of processes to encode DataFrames in.
+            By default they are encoded in the uploading threads
+        :param max_pending: (optional, int) maximum number of payloads being encoded or waiting for
+            or in upload at any time. Defaults to ``max_workers`` plus ``encode_processes``
+
+        :return: (dict) ``DataGroup`` => dict with keys ``status`` (the final status of the data group),
+            ``encode_time``, ``upload_time``, ``processing_time`` and ``total_time`` (in seconds), ``skipped``
+            (whether the upload was skipped) and ``error`` (the exception raised while refreshing, or ``None``)
+        """
+        if not data:
+            return {}
+        if poll_interval <= 0:
+            raise DataMonsterError('poll_interval must be positive, got {}'.format(poll_interval))
+
+        if max_pending is None:
+            max_pending = max_workers + (encode_processes or 0)
+        payload_slots = threading.Semaphore(max_pending)
+        upload_slots = threading.Semaphore(max_workers)
+        encode_executor = ProcessPoolExecutor(encode_processes) if encode_processes else None
+
+        def refresh(data_group, data_frame):
+            result = {'status': 'error', 'encode_time': None, 'upload_time': None, 'processing_time': None,
+                      'total_time': None, 'skipped': False, 'error': None}
+            start = time.time()
+            try:
+                content_hash = dataframe_content_hash(data_frame) if skip_unchanged else None
+                if data_group._is_last_upload(content_hash):
+                    result['skipped'] = True
+                    result['status'] = data_group.status
+                else:
+                    with payload_slots:
+                        avro_file = data_group._encode_refresh_data(data_frame, encode_executor)
+                        encoded = time.time()
+                        result['encode_time'] = encoded - start
+                        with upload_slots:
+                            data_group._post_refresh(avro_file, content_hash)
+                        del avro_file
+                    uploaded = time.time()
+                    result['upload_time'] = uploaded - encoded
+                    result['status'] = data_group.wait_for_refresh(poll_interval, max_poll_interval, timeout)
+                    result['processing_time'] = time.time() - uploaded
+            except Exception as e:
+                result['error'] = e
+            result['total_time'] = time.time() - start
+            return result
+
+        # One thread per data group, so that waiting on a slow group never delays polling the others
+        try:
+            with ThreadPoolExecutor(max_workers=len(data)) as executor:
+                futures = {
+                    data_group: executor.submit(refresh, data_group, data_frame)
+                    for data_group, data_frame in data.items()
+                }
+        finally:
+            if encode_executor is not None:
+                encode_executor.shutdown()
+        return {data_group: future.result() for data_group, future in futures.items()}
+
     def _data_group_result_to_object(self, data_group, has_details=False):
         columns = [DataGroupColumn(**column) for column in data_group['columns']]
         dg_inst = DataGroup(
@@ -0,0 +1,496 @@
+import fastavro
+import io
+import itertools
+import numpy
+import operator
+import pandas
+import six
+from concurrent.futures import ProcessPoolExecutor
+
+from .errors import DataMonsterError
+from .utils import format_date
+
+NUMBER_DATA_TYPES = ("number", "float")
+
+
+class RowFilter(object):
+    """Predicate evaluated on rawdata records while they are decoded, so that rows which do not match
+    are never turned into DataFrame rows
+
+    The date bounds have the meaning of the ``start_date`` and ``end_date`` arguments of
+    ``DataMonster.get_data``: rows are kept if they end on or after ``start_date`` and start
+    on or before ``end_date``.
+
+    :param start_date: Optional date; keep rows ending on or after it
+    :param end_date: Optional date; keep rows starting on or before it
+    :param equals: Optional dict of column name => value, or list of values, to keep
+    """
+
+    def __init__(self, start_date=None, end_date=None, equals=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.equals = equals or {}
+
+    def __bool__(self):
+        return self.start_date is not None or self.end_date is not None or bool(self.equals)
+
+    __nonzero__ = __bool__
+
+    def compile(self, structure):
+        """Build the predicate for records described by ``structure``
+
+        :param structure: (dict) the ``structure`` of the rawdata avro schema, naming the date columns
+        :return: function taking a record (dict) and returning whether to keep it
+        :raises: ``DataMonsterError`` if ``equals`` names columns that are not in ``structure``
+        """
+        known = set(col for cols in structure.values() if isinstance(cols, list) for col in cols)
+        unknown = [name for name in self.equals if name not in known]
+        if unknown:
+            raise DataMonsterError("Unknown columns {!r}. Expected some of {!r}".format(
+                unknown, sorted(structure.get("split", []))
+            ))
+
+        checks = []
+
+        # Dates are ISO strings in rawdata records, so they are compared without parsing them. The upper
+        # date is exclusive, so a row ends on or after `start_date` iff its upper date is after it.
+        # Records with values of any other type are kept, and left to the filters applied after decoding.
+        if self.start_date is not None and structure.get("upper_date"):
+            upper, lowest = structure["upper_date"][0], format_date(self.start_date)
+
+            def check_upper(record):
+                value = record[upper]
+                return not isinstance(value, six.string_types) or value[:10] > lowest
+            checks.append(check_upper)
+
+        if self.end_date is not None and structure.get("lower_date"):
+            lower, highest = structure["lower_date"][0], format_date(self.end_date)
+
+            def check_lower(record):
+                value = record[lower]
+                return not isinstance(value, six.string_types) or value[:10] <= highest
+            checks.append(check_lower)
+
+        for name, values in self.equals.items():
+            allowed = frozenset(values) if isinstance(values, (list, tuple, set, frozenset)) else frozenset([values])
+            checks.append(lambda record, name=name, allowed=allowed: record.get(name) in allowed)
+
+        if len(checks) == 1:
+            return checks[0]
+        return lambda record: all(check(record) for check in checks)
+
+
+class DtypePolicy(object):
+    """Memory saving dtypes for decoded data
+
+    :param max_category_ratio: (float) string columns with at most this many distinct values per row
+        are stored as ``category`` columns. 0 keeps all strings as objects
+    :param downcast: (bool) store integers in the smallest dtype holding them, and floats as ``float32``,
+        which keeps about 7 significant digits
+    :param intern_dimensions: (bool) rows of ``DataMonster.get_data`` with the same splits share a single
+        ``dimensions`` dict, so these dicts must not be modified in place
+    """
+
+    def __init__(self, max_category_ratio=0.5, downcast=False, intern_dimensions=True):
+        self.max_category_ratio = max_category_ratio
+        self.downcast = downcast
+        self.intern_dimensions = intern_dimensions
+
+    def __repr__(self):
+        return "<{}: max_category_ratio={!r}, downcast={!r}, intern_dimensions={!r}>".format(
+            self.__class__.__name__, self.max_category_ratio, self.downcast, self.intern_dimensions
+        )
+
+    def apply(self, df):
+        """Convert the columns of ``df`` in place
+
+        :param df: pandas.DataFrame
+        :return: ``df``
+        """
+        for name in df.columns:
+            column = df[name]
+            if column.dtype == object:
+                if self.max_category_ratio and len(column) and self._is_categorical(column):
+                    df[name] = column.astype("category")
+            elif self.downcast and pandas.api.types.is_integer_dtype(column):
+                df[name] = pandas.to_numeric(column, downcast="integer")
+            elif self.downcast and pandas.api.types.is_float_dtype(column):
+                df[name] = column.astype("float32")
+        return df
+
+    def _is_categorical(self, column):
+        return (
+            column.nunique() <= self.max_category_ratio * len(column)
+            and pandas.api.types.infer_dtype(column, skipna=True) == "string"
+        )
+
+
+def interned_dimensions(df, split_columns):
+    """Build the ``dimensions`` column of ``DataMonster.get_data``, with a single dict shared by all rows
+    with the same splits
+
+    :param df: pandas.DataFrame holding ``split_columns``
+    :param split_columns: (list) names of the split columns
+    :return: numpy array of dict, one per row
+    """
+    if not split_columns:
+        dimensions = numpy.empty(len(df), dtype=object)
+        dimensions.fill({})
+        return dimensions
+
+    # Grouped on the codes of the values, in which missing values (-1) are a group like any other
+    codes = [pandas.factorize(df[col])[0] for col in split_columns]
+    groups = pandas.Series(numpy.arange(len(df))).groupby(codes, sort=False).ngroup().values
+    _, first_rows = numpy.unique(groups, return_index=True)
+    distinct = numpy.empty(len(first_rows), dtype=object)
+    distinct[:] = df[split_columns].iloc[first_rows].to_dict("records")
+    return distinct[groups]
+
+
+def decode_avro(fo, data_types, row_filter=None, columns=None):
+    """Read a rawdata avro file into a dataframe and minimally parse it
+
+    Values are collected column by column and date columns are parsed in bulk once all rows are read.
+
+    :param fo: file-like object holding the avro data
+    :param data_types: (list of dict) ``fields`` of the data source, with ``name`` and ``data_type``
+    :param row_filter: Optional ``RowFilter`` selecting the rows to keep
+    :param columns: Optional list of the fields to keep, or function taking the ``structure`` of the
+        data and returning that list. Other fields are dropped from each record as it is read
+
+    :return: (schema, pandas.DataFrame)
+    """
+    metadata, data_types, rows = _iter_rows(fo, data_types, row_filter, columns)
+    return metadata, _rows_to_frame(list(rows), data_types)
+
+
+def decode_avro_arrow(fo, data_types, row_filter=None, columns=None):
+    """Read a rawdata avro file into a ``pyarrow.Table``
+
+    String columns are dictionary encoded, so each distinct split value is stored once, and date
+    columns are parsed into timestamps. Takes the same arguments as ``decode_avro``.
+
+    :return: (schema, pyarrow.Table)
+    """
+    pyarrow = _import_pyarrow()
+    metadata, data_types, rows = _iter_rows(fo, data_types, row_filter, columns)
+    return metadata, _rows_to_table(pyarrow, list(rows), data_types)
+
+
+def iter_decode_avro(fo, data_types, row_filter=None, columns=None, chunk_size=100000, output="pandas"):
+    """Read a rawdata avro file in chunks of rows, while it is being read
+
+    Only the records of the current chunk are held, so ``fo`` can be a stream of any size. Takes the
+    same arguments as ``decode_avro``.
+
+    :param chunk_size: (int) maximum number of rows in each chunk
+    :param output: ``"pandas"`` or ``"arrow"``, for chunks as in ``decode_avro`` or ``decode_avro_arrow``
+
+    :return: (schema, iterator of pandas.DataFrame or pyarrow.Table)
+    """
+    pyarrow = _import_pyarrow() if output == "arrow" else None
+    metadata, data_types, rows = _iter_rows(fo, data_types, row_filter, columns)
+
+    def chunks():
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            if pyarrow is None:
+                yield _rows_to_frame(chunk, data_types)
+            else:
+                yield _rows_to_table(pyarrow, chunk, data_types)
+
+    return metadata, chunks()
+
+
+def decode_avro_chunked(fo, data_types, row_filter=None, columns=None, chunk_size=100000, output="pandas",
+                        dtypes=None, limit=None):
+    """Read a rawdata avro file chunk by chunk while it is being read, and concatenate the chunks
+
+    Unlike ``decode_avro``, the records are never all held at once: each chunk is turned into columns, and
+    compacted with ``dtypes``, before the next one is read. Takes the same arguments as ``iter_decode_avro``.
+
+    :param dtypes: Optional ``DtypePolicy`` applied to each chunk. pandas output only
+    :param limit: Optional number of rows after which reading stops. The rest of ``fo`` is left unread
+
+    :return: (schema, pandas.DataFrame or pyarrow.Table)
+    """
+    pyarrow = _import_pyarrow() if output == "arrow" else None
+    metadata, data_types, rows = _iter_rows(fo, data_types, row_filter, columns)
+    if limit is not None:
+        rows = itertools.islice(rows, limit)
+        chunk_size = min(chunk_size, limit) or 1
+
+    parts = []
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if pyarrow is not None:
+            parts.append(_rows_to_table(pyarrow, chunk, data_types))
+        else:
+            parts.append(_rows_to_frame(chunk, data_types))
+            if dtypes is not None:
+                dtypes.apply(parts[-1])
+        if len(chunk) < chunk_size:
+            break
+
+    if pyarrow is not None:
+        return metadata, pyarrow.concat_tables([table for table in parts if table.num_rows] or parts[:1])
+    return metadata, concat_frames(parts)
+
+
+def empty_data(data_types, output="pandas"):
+    """
+    :param data_types: (list of dict) ``fields`` of the data source
+    :param output: ``"pandas"`` or ``"arrow"``
+    :return: pandas.DataFrame or pyarrow.Table with the columns of a decoded empty avro file
+    """
+    if output == "arrow":
+        return _rows_to_table(_import_pyarrow(), [], data_types)
+    return _rows_to_frame([], data_types)
+
+
+def _rows_to_frame(rows, data_types):
+    df = pandas.DataFrame.from_records(rows, columns=[col["name"] for col in data_types])
+
+    for col in data_types:
+        if col["data_type"] == "date":
+            df[col["name"]] = pandas.to_datetime(df[col["name"]])
+
+    return df
+
+
+def _rows_to_table(pyarrow, rows, data_types):
+    # Every chunk gets the same types, whatever values it holds, so that the chunks of a dataset concatenate
+    values = list(zip(*rows)) if rows else [()] * len(data_types)
+
+    arrays = []
+    for col, column_values in zip(data_types, values):
+        if col["data_type"] == "date":
+            array = pyarrow.array(column_values, type=pyarrow.string()).cast(pyarrow.timestamp("ns"))
+        elif col["data_type"] == "integer":
+            array = pyarrow.array(column_values, type=pyarrow.int64())
+        elif col["data_type"] in NUMBER_DATA_TYPES:
+            array = pyarrow.array(column_values, type=pyarrow.float64())
+        else:
+            array = pyarrow.array(column_values, type=pyarrow.string()).dictionary_encode()
+        arrays.append(array)
+
+    return pyarrow.Table.from_arrays(arrays, names=[col["name"] for col in data_types])
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise DataMonsterError('pyarrow is required for Arrow output')
+    return pyarrow
+
+
+def decode_avro_parallel(buffer, data_types, processes, row_filter=None, columns=None):
+    """Read a rawdata avro file into a dataframe, decoding its blocks in several processes
+
+    The blocks of the file are split into one contiguous range per process, and each range is decoded
+    like a file of its own. The file is handed to the processes in shared memory, where available, so
+    that each of them only copies its own range. Takes the same arguments as ``decode_avro``.
+
+    :param buffer: (bytes) the avro data
+    :param processes: (int) number of processes to decode with. With fewer than 2, or a single block
+        of data, the data is decoded in this process
+
+    :return: (schema, pandas.DataFrame)
+    """
+    header_end, blocks = avro_blocks(buffer)
+    processes = min(processes or 1, len(blocks))
+    if processes < 2:
+        return decode_avro(io.BytesIO(buffer), data_types, row_filter, columns)
+
+    header = bytes(buffer[:header_end])
+    if callable(columns):
+        columns = columns(fastavro.reader(io.BytesIO(header)).writer_schema.get("structure", {}))
+
+    # Contiguous ranges of blocks, of about the same size
+    total = blocks[-1][1] - header_end
+    ranges, start = [], header_end
+    for block_start, block_end in blocks:
+        if block_end - header_end >= total * (len(ranges) + 1) / processes:
+            ranges.append((start, block_end))
+            start = block_end
+
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        shared = None
+        parts = [bytes(buffer[start:end]) for start, end in ranges]
+    else:
+        shared = shared_memory.SharedMemory(create=True, size=len(buffer))
+        shared.buf[:len(buffer)] = buffer
+        parts = ranges
+
+    try:
+        with ProcessPoolExecutor(len(parts)) as executor:
+            futures = [
+                executor.submit(
+                    _decode_part, header, part, shared and shared.name, data_types, row_filter, columns
+                )
+                for part in parts
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        if shared is not None:
+            shared.close()
+            shared.unlink()
+
+    return results[0][0], concat_frames([df for _, df in results])
+
+
+def concat_frames(frames):
+    """Concatenate frames decoded from parts of the same data
+
+    Empty frames can have other dtypes, e.g. object for numbers, so they are left out. Categorical columns
+    stay categorical, with the union of the categories of all frames.
+
+    :param frames: non-empty list of pandas.DataFrame with the same columns
+    :return: pandas.DataFrame
+    """
+    frames = [df for df in frames if len(df)] or frames[:1]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    for name in frames[0].columns:
+        if all(isinstance(df[name].dtype, pandas.CategoricalDtype) for df in frames):
+            categories = pandas.api.types.union_categoricals([df[name] for df in frames]).categories
+            for df in frames:
+                df[name] = df[name].cat.set_categories(categories)
+    return pandas.concat(frames, ignore_index=True)
+
+
+def _decode_part(header, part, shared_name, data_types, row_filter, columns):
+    """Decode a range of blocks of an avro file in a worker process
+
+    :param header: (bytes) header of the avro file
+    :param part: (bytes) the blocks or, if ``shared_name`` is set, their start and end offsets
+    :param shared_name: Optional name of the shared memory holding the whole avro file
+    """
+    if shared_name is not None:
+        from multiprocessing import shared_memory
+
+        shared = shared_memory.SharedMemory(name=shared_name)
+        try:
+            start, end = part
+            part = bytes(shared.buf[start:end])
+        finally:
+            shared.close()
+    return decode_avro(io.BytesIO(header + part), data_types, row_filter, columns)
+
+
+def avro_blocks(buffer):
+    """Find the data blocks of an avro container file, without decoding them
+
+    :param buffer: (bytes) the avro data
+    :return: (int, list of (int, int)) the offset where the header ends, and the start and end offsets of
+        each block, sync marker included
+    :raises: ``DataMonsterError`` if the data is not an avro container file
+    """
+    buffer = memoryview(buffer)
+    if bytes(buffer[:4]) != b"Obj\x01":
+        raise DataMonsterError("Not an avro container file")
+
+    try:
+        # Metadata map: blocks of entries, the last one empty. Negative counts are followed by the block size
+        position = 4
+        while True:
+            count, position = _read_long(buffer, position)
+            if count == 0:
+                break
+            if count < 0:
+                count = -count
+                _, position = _read_long(buffer, position)
+            for _ in range(2 * count):
+                length, position = _read_long(buffer, position)
+                position += length
+        sync = bytes(buffer[position:position + 16])
+        header_end = position = position + 16
+
+        blocks = []
+        while position < len(buffer):
+            start = position
+            _, position = _read_long(buffer, position)
+            size, position = _read_long(buffer, position)
+            position += size
+            if bytes(buffer[position:position + 16]) != sync:
+                raise DataMonsterError("Corrupt avro data: no sync marker at offset {}".format(position))
+            position += 16
+            blocks.append((start, position))
+    except IndexError:
+        raise DataMonsterError("Corrupt avro data: truncated")
+
+    return header_end, blocks
+
+
+def _read_long(buffer, position):
+    """Read a zigzag encoded avro long
+
+    :return: (int, int) the value and the position after it
+    """
+    byte = buffer[position]
+    value, shift = byte & 0x7F, 7
+    while byte & 0x80:
+        position += 1
+        byte = buffer[position]
+        value |= (byte & 0x7F) << shift
+        shift += 7
+    return (value >> 1) ^ -(value & 1), position + 1
+
+
+def _iter_rows(fo, data_types, row_filter, columns):
+    """Read the records of a rawdata avro file
+
+    Records are decoded whole, and the fields not in ``columns`` dropped afterwards: reading with a projected
+    reader schema goes through the schema resolution of fastavro, which is several times slower than
+    decoding all the fields.
+
+    :return: (schema, list of dict, iterator of tuple) the ``structure`` of the data, the fields kept and
+        one tuple of their values per row kept
+    """
+    reader = fastavro.reader(fo)
+    metadata = reader.writer_schema.get("structure", ())
+
+    if not metadata:
+        raise DataMonsterError(
+            "DataMonster does not currently support this request"
+        )
+
+    if columns is not None:
+        data_types = project_fields(data_types, columns(metadata) if callable(columns) else columns)
+
+    names = [col["name"] for col in data_types]
+    records = reader
+    if row_filter:
+        keep = row_filter.compile(metadata)
+        records = (record for record in reader if keep(record))
+
+    if not names:
+        rows = (() for record in records)
+    elif len(names) == 1:
+        name, = names
+        rows = ((record[name],) for record in records)
+    else:
+        rows = six.moves.map(operator.itemgetter(*names), records)
+    return metadata, data_types, rows
+
+
+def project_fields(data_types, columns):
+    """
+    :param data_types: (list of dict) ``fields`` of the data source
+    :param columns: (list) names of the fields to keep
+    :return: (list of dict) the fields named in ``columns``, in the data source's order
+    """
+    known = set(col["name"] for col in data_types)
+    unknown = [name for name in columns if name not in known]
+    if unknown:
+        raise DataMonsterError("Unknown columns {!r}. Expected some of {!r}".format(
+            unknown, [col["name"] for col in data_types]
+        ))
+    columns = set(columns)
+    return [col for col in data_types if col["name"] in columns]
@@ -1,2 +1,6 @@
 class DataMonsterError(Exception):
     pass
+
+
+class DataTooLargeError(DataMonsterError):
+    pass
@@ -0,0 +1,124 @@
+import numpy
+import pandas
+
+from .errors import DataMonsterError
+
+
+class FiscalCalendar(object):
+    """Fiscal quarters of a company, used to label dates with the fiscal period they fall in
+
+    Quarter end dates are kept in a sorted array, so that whole columns of dates are labeled
+    with a single binary search instead of row by row.
+
+    :param quarter_dates: (list) end dates of the fiscal quarters, e.g. ``Company.quarters``
+        (``MM-DD-YYYY`` strings), or anything else accepted by ``pandas.to_datetime``
+    :param fiscal_year_end_month: (optional, int) month in which the fiscal year ends. Quarters ending
+        up to four weeks after the end of this month, as happens with 52-53 week years, still count
+        towards the fiscal year ending in it
+    """
+
+    # how late after the end of `fiscal_year_end_month` a fourth quarter may end
+    year_end_grace = numpy.timedelta64(28, "D")
+
+    def __init__(self, quarter_dates, fiscal_year_end_month=12):
+        if not quarter_dates:
+            raise DataMonsterError("A fiscal calendar needs at least one quarter date")
+
+        quarter_format = "%m-%d-%Y" if isinstance(quarter_dates[0], str) else None
+        quarter_ends = pandas.to_datetime(quarter_dates, format=quarter_format)
+        self.quarter_ends = numpy.unique(quarter_ends.values.astype("datetime64[ns]"))
+        self.fiscal_year_end_month = fiscal_year_end_month
+
+        shifted = pandas.DatetimeIndex(self.quarter_ends - self.year_end_grace)
+        self.fiscal_years = shifted.year.values + (shifted.month.values > fiscal_year_end_month)
+        self.fiscal_quarters = self._number_quarters(self.fiscal_years)
+
+    @classmethod
+    def from_company(cls, company, fiscal_year_end_month=12):
+        """
+        :param company: ``Company`` object
+        :return: ``FiscalCalendar`` built from ``company.quarters``
+        """
+        if not company.quarters:
+            raise DataMonsterError("{!r} has no fiscal quarters".format(company))
+        return cls(company.quarters, fiscal_year_end_month)
+
+    def __repr__(self):
+        return "<{}: {} quarters, {} to {}>".format(
+            self.__class__.__name__,
+            len(self.quarter_ends),
+            pandas.Timestamp(self.quarter_ends[0]).date(),
+            pandas.Timestamp(self.quarter_ends[-1]).date(),
+        )
+
+    @staticmethod
+    def _number_quarters(fiscal_years):
+        """Number the quarters of each fiscal year from 1 to 4
+
+        A fiscal year that is only partly covered is numbered from its end if it is the first one,
+        since the quarters before are the ones missing, and from its start otherwise.
+        """
+        years = pandas.Series(fiscal_years)
+        from_start = years.groupby(years).cumcount().values + 1
+        from_end = 4 - years.groupby(years).cumcount(ascending=False).values
+        return numpy.where(fiscal_years == fiscal_years[0], from_end, from_start)
+
+    def locate(self, dates):
+        """
+        :param dates: list, numpy array or pandas.Series of dates
+        :return: (numpy array of int) for each date, the position in ``quarter_ends`` of the quarter
+            it falls in, or -1 if it is after the last known quarter
+        """
+        values = pandas.to_datetime(pandas.Series(dates)).values
+        index = numpy.searchsorted(self.quarter_ends, values, side="left")
+        index[(index == len(self.quarter_ends)) | pandas.isnull(values)] = -1
+        return index
+
+    def period_bounds(self, dates):
+        """
+        :param dates: pandas.Series of datetime64
+        :return: (pandas.Series, pandas.Series) the first day of the fiscal quarter holding each date
+            and the day after its last day. NaT where the quarter or its start is not known
+        """
+        index = self.locate(dates)
+        known = index > 0
+        one_day = numpy.timedelta64(1, "D")
+        start = numpy.full(len(index), numpy.datetime64("NaT"), dtype="datetime64[ns]")
+        end = start.copy()
+        start[known] = self.quarter_ends[index[known] - 1] + one_day
+        end[known] = self.quarter_ends[index[known]] + one_day
+        return pandas.Series(start, index=dates.index), pandas.Series(end, index=dates.index)
+
+    def label(self, dates):
+        """Label dates with the fiscal quarter they fall in
+
+        :param dates: list, numpy array or pandas.Series of dates
+        :return: pandas.DataFrame with one row per date (and the index of ``dates`` if it is a Series)
+            and columns ``fiscal_year``, ``fiscal_quarter`` (1 to 4), ``period_start`` and ``period_end``
+            (first and last day of the quarter). Missing where the date is after the last known quarter;
+            ``period_start`` is also missing for dates in the first known quarter
+        """
+        index = self.locate(dates)
+        known = index >= 0
+        one_day = numpy.timedelta64(1, "D")
+
+        fiscal_year = numpy.full(len(index), numpy.nan)
+        fiscal_quarter = numpy.full(len(index), numpy.nan)
+        period_start = numpy.full(len(index), numpy.datetime64("NaT"), dtype="datetime64[ns]")
+        period_end = period_start.copy()
+
+        fiscal_year[known] = self.fiscal_years[index[known]]
+        fiscal_quarter[known] = self.fiscal_quarters[index[known]]
+        period_end[known] = self.quarter_ends[index[known]]
+        has_start = index > 0
+        period_start[has_start] = self.quarter_ends[index[has_start] - 1] + one_day
+
+        return pandas.DataFrame(
+            {
+                "fiscal_year": fiscal_year,
+                "fiscal_quarter": fiscal_quarter,
+                "period_start": period_start,
+                "period_end": period_end,
+            },
+            index=dates.index if isinstance(dates, pandas.Series) else None,
+        )
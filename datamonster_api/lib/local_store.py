@@ -0,0 +1,132 @@
+import errno
+import hashlib
+import json
+import os
+import time
+
+from .errors import DataMonsterError
+
+
+class LocalStore(object):
+    """Store of fetched data in a local directory, shared by all the processes of a host
+
+    Each dataset is written once, as an Arrow IPC file, and read back memory-mapped: the processes
+    reading it share a single copy in the page cache instead of each holding its own. While a process
+    is fetching a dataset, the others wanting it wait for it rather than fetching it too. Requires pyarrow.
+
+    :param path: (str) directory of the store, created if it does not exist
+    :param max_age: (optional, float) seconds after which a dataset is fetched again. ``None`` keeps
+        datasets until they are removed with ``clear``
+    :param lock_timeout: (optional, float) age in seconds after which the lock of another process fetching
+        a dataset is assumed to have been left by a dead process: it is broken, and one of the waiting
+        processes fetches the dataset
+    """
+
+    def __init__(self, path, max_age=None, lock_timeout=600):
+        try:
+            import pyarrow  # noqa
+        except ImportError:
+            raise DataMonsterError('pyarrow is required for a LocalStore')
+
+        self.path = path
+        self.max_age = max_age
+        self.lock_timeout = lock_timeout
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __repr__(self):
+        return "<{}: {}>".format(self.__class__.__name__, self.path)
+
+    def _file_path(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest + ".arrow")
+
+    def get(self, key):
+        """
+        :param key: JSON serializable key of the dataset
+        :return: (pyarrow.Table) the dataset, memory-mapped, or ``None`` if it is not in the store or too old
+        """
+        import pyarrow
+
+        file_path = self._file_path(key)
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(file_path) > self.max_age:
+                return None
+            source = pyarrow.memory_map(file_path)
+        except (IOError, OSError):
+            return None
+        return pyarrow.ipc.open_file(source).read_all()
+
+    def put(self, key, table):
+        """Write the dataset to the store, replacing any other version of it
+
+        :param key: JSON serializable key of the dataset
+        :param table: pyarrow.Table
+        """
+        import pyarrow
+
+        file_path = self._file_path(key)
+        tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        with pyarrow.OSFile(tmp_path, "wb") as sink:
+            writer = pyarrow.ipc.new_file(sink, table.schema)
+            writer.write_table(table)
+            writer.close()
+        os.replace(tmp_path, file_path)
+
+    def get_or_create(self, key, create):
+        """Get the dataset from the store, creating it if it is not there
+
+        Only one process creates a given dataset at a time, and the others wait for it.
+
+        :param key: JSON serializable key of the dataset
+        :param create: function returning the dataset as a pyarrow.Table
+        :return: (pyarrow.Table) the dataset, memory-mapped
+        """
+        table = self.get(key)
+        if table is not None:
+            return table
+
+        lock_path = self._file_path(key) + ".lock"
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            if self._lock_is_stale(lock_path):
+                # The process holding the lock died: break it, and let a single waiter take it over
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+                continue
+            time.sleep(0.1)
+            table = self.get(key)
+            if table is not None:
+                return table
+
+        try:
+            self.put(key, create())
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+        return self.get(key)
+
+    def _lock_is_stale(self, lock_path):
+        try:
+            return time.time() - os.path.getmtime(lock_path) > self.lock_timeout
+        except OSError:
+            # The lock was just released
+            return False
+
+    def clear(self):
+        """Remove all the datasets from the store, with the locks and partial files left by their creation"""
+        for name in os.listdir(self.path):
+            if name.endswith((".arrow", ".lock", ".tmp")):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
@@ -0,0 +1,123 @@
+import pandas
+
+from .utils import format_date
+
+
+class CoveragePlanner(object):
+    """Plans rawdata requests from the dimension metadata of a data source
+
+    The ``min_date``, ``max_date`` and ``row_count`` of the dimensions are summed up by company, so that
+    requests that can not return any row are skipped, and companies are batched by expected size.
+    Dates are taken to be the span of the dates of the rows of each dimension. If the dimensions are not
+    split by company, nothing is known of the companies and all of them are taken to have rows.
+
+    :param dimensions: iterable of dimension dicts, e.g. a ``DimensionSet``
+    """
+
+    def __init__(self, dimensions):
+        # section_pk => [min_date, max_date, row_count]
+        self.coverage = {}
+        self.by_company = True
+        for dimension in dimensions:
+            section_pks = dimension["split_combination"].get("section_pk")
+            if section_pks is None:
+                self.by_company = False
+                continue
+            if not isinstance(section_pks, list):
+                section_pks = [section_pks]
+
+            min_date = self._to_date(dimension["min_date"])
+            max_date = self._to_date(dimension["max_date"])
+            for section_pk in section_pks:
+                coverage = self.coverage.get(int(section_pk))
+                if coverage is None:
+                    self.coverage[int(section_pk)] = [min_date, max_date, dimension["row_count"]]
+                else:
+                    # an unknown date leaves the span of the company unknown
+                    coverage[0] = None if None in (coverage[0], min_date) else min(coverage[0], min_date)
+                    coverage[1] = None if None in (coverage[1], max_date) else max(coverage[1], max_date)
+                    coverage[2] += dimension["row_count"]
+
+    def __repr__(self):
+        return "<{}: {} companies>".format(self.__class__.__name__, len(self.coverage))
+
+    @staticmethod
+    def _to_date(value):
+        return None if value is None else pandas.Timestamp(format_date(value)).date()
+
+    def expected_rows(self, section_pk, start_date=None, end_date=None):
+        """
+        :param section_pk: (int) company
+        :param start_date: Optional date; only count rows ending on or after it
+        :param end_date: Optional date; only count rows starting on or before it
+        :return: (int) number of rows expected for the company between the dates, assuming its rows are spread
+            evenly between its ``min_date`` and ``max_date``. 0 if the company is not covered, and ``None`` if
+            the dimensions are not split by company
+        """
+        coverage = self.coverage.get(int(section_pk))
+        if coverage is None:
+            return 0 if self.by_company else None
+
+        min_date, max_date, row_count = coverage
+        if min_date is None or max_date is None:
+            return row_count
+
+        start = max(min_date, self._to_date(start_date) or min_date)
+        end = min(max_date, self._to_date(end_date) or max_date)
+        if start > end:
+            return 0
+        span = (max_date - min_date).days + 1
+        return int(round(row_count * float((end - start).days + 1) / span))
+
+    def covers(self, section_pk, start_date=None, end_date=None):
+        """
+        :return: (bool) whether the company may have rows between the dates. See ``expected_rows``
+        """
+        if not self.by_company:
+            return True
+        coverage = self.coverage.get(int(section_pk))
+        if coverage is None or not coverage[2]:
+            return False
+
+        min_date, max_date, _ = coverage
+        start, end = self._to_date(start_date), self._to_date(end_date)
+        return not (
+            (start is not None and max_date is not None and max_date < start)
+            or (end is not None and min_date is not None and min_date > end)
+        )
+
+    def batches(self, section_pks, max_rows, max_size=None, start_date=None, end_date=None):
+        """Group the companies that may have rows between the dates into batches of about ``max_rows`` rows
+
+        Companies are placed from the largest, each into the first batch with room for it, so that batches
+        are balanced and small companies fill in around large ones. A company with more than ``max_rows``
+        rows gets a batch of its own. If the dimensions are not split by company, companies are batched
+        by ``max_size`` only.
+
+        :param section_pks: (list of int) companies
+        :param max_rows: (int) number of rows expected in each batch, at most
+        :param max_size: (optional, int) number of companies in each batch, at most
+        :return: list of list of int, batches of section_pks, largest first
+        """
+        if not self.by_company:
+            section_pks = sorted(int(section_pk) for section_pk in section_pks)
+            max_size = max_size or len(section_pks) or 1
+            return [section_pks[i:i + max_size] for i in range(0, len(section_pks), max_size)]
+
+        sizes = [
+            (self.expected_rows(section_pk, start_date, end_date), int(section_pk))
+            for section_pk in section_pks
+            if self.covers(section_pk, start_date, end_date)
+        ]
+
+        batches = []  # [rows, section_pks]
+        for rows, section_pk in sorted(sizes, key=lambda size: (-size[0], size[1])):
+            for batch in batches:
+                if batch[0] + rows <= max_rows and (max_size is None or len(batch[1]) < max_size):
+                    batch[0] += rows
+                    batch[1].append(section_pk)
+                    break
+            else:
+                batches.append([rows, [section_pk]])
+
+        return [sorted(section_pks) for _, section_pks in batches]
@@ -1,5 +1,7 @@
 import datetime
 import decimal
+import hashlib
+import os
 from dateutil import parser
 import numpy
 import pandas as pd
@@ -10,6 +12,8 @@ from io import BytesIO
 from avro.datafile import DataFileWriter
 from avro.io import DatumWriter
 
+from .errors import DataMonsterError, DataTooLargeError
+
 ACCEPTED_DATETIMES = [
     "datetime.date",
     "datetime.datetime",
@@ -23,6 +27,10 @@ ERROR_MESSAGE = "Unsupported date found {{0.__class__}}={{0!r}}. Please pass one
     accepted=ACCEPTED_DATETIMES
 )
 
+ISO_DATE_REGEX = r'^\d{4}-\d{2}-\d{2}$'
+
+RECORD_CHUNK_SIZE = 10000  # rows converted to dicts at a time while encoding
+
 DATAFRAME_TYPES = {
     np.int64: 'long',
     np.float64: 'double',
@@ -51,10 +59,67 @@ def format_date(date):
     raise ValueError(ERROR_MESSAGE.format(date))
 
 
-def dataframe_to_avro_bytes(df, name, namespace):
-    data_fields = df.columns
+def format_dates(dates):
+    """Format many dates at once, as ``format_date`` would format each of them
+
+    Already-ISO (``YYYY-MM-DD``) strings are checked in bulk without being parsed, datetime64 values
+    are formatted in bulk, and every other distinct value is parsed only once.
+
+    :param dates: list, numpy array or pandas.Series of dates, in any format accepted by ``format_date``
+
+    :return: the ``YYYY-MM-DD`` strings, as a pandas.Series with the index of ``dates`` if it is a Series,
+        as a numpy array if it is an array, and as a list otherwise
+    :raises: ``ValueError`` if any of the dates is not supported
+    """
+    if isinstance(dates, pd.Series):
+        series = dates
+    elif len(dates) == 0:
+        series = pd.Series([], dtype=object)
+    else:
+        series = pd.Series(dates if isinstance(dates, np.ndarray) else list(dates))
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if series.isnull().any():
+            raise ValueError(ERROR_MESSAGE.format(series[series.isnull()].iloc[0]))
+        if series.dt.tz is not None:
+            # the dates of the time zone of the values, as format_date gives them
+            series = series.dt.tz_localize(None)
+        formatted = series.dt.strftime('%Y-%m-%d')
+    else:
+        if pd.api.types.is_extension_array_dtype(series):
+            # e.g. categoricals, whose values are formatted as any other
+            series = series.astype(object)
+        try:
+            codes, uniques = pd.factorize(series)
+        except TypeError:
+            # unhashable values, which format_date rejects
+            return [format_date(date) for date in series]
+        if (codes == -1).any():
+            raise ValueError(ERROR_MESSAGE.format(series[codes == -1].iloc[0]))
+
+        uniques = np.asarray(uniques, dtype=object)
+        is_iso = np.array([isinstance(date, str) for date in uniques], dtype=bool)
+        candidates = pd.Series(uniques[is_iso], dtype=object)
+        # ISO strings that are not real dates (e.g. 2019-02-30) fall back to format_date, which raises
+        is_iso[is_iso] = (
+            candidates.str.match(ISO_DATE_REGEX).astype(bool) &
+            pd.to_datetime(candidates, format='%Y-%m-%d', errors='coerce').notnull()
+        ).values
+
+        uniques[~is_iso] = [format_date(date) for date in uniques[~is_iso]]
+        formatted = pd.Series(uniques.take(codes), index=series.index)
+
+    if isinstance(dates, pd.Series):
+        return formatted.rename(dates.name)
+    if isinstance(dates, np.ndarray):
+        return formatted.values.astype(object)
+    return formatted.tolist()
+
+
+def dataframe_avro_schema(df, name, namespace):
+    """Build the avro record schema for ``df`` from the type of the first non-null value of each column"""
     fields = []
-    for field in data_fields:
+    for field in df.columns:
         data_type = type(df[field][df[field].notnull()].iloc[0])
         item = {
             'name': field,
@@ -62,36 +127,135 @@ def dataframe_to_avro_bytes(df, name, namespace):
         }
         fields.append(item)
 
-    schema = {
+    return {
         'name': name,
         'namespace': namespace,
         'type': 'record',
         'fields': fields
     }
 
-    df_lst = df.to_dict('records')
-    df_lst = [convert_dict_fields_to_str(d) for d in df_lst]
 
-    schema = json.dumps(schema)
-    return avro_dumps(df_lst, schema)
+def dataframe_records(df, chunk_size=RECORD_CHUNK_SIZE):
+    """Yield the rows of ``df`` as avro-ready dicts, converting ``chunk_size`` rows at a time"""
+    for start in range(0, len(df), chunk_size):
+        for record in df.iloc[start:start + chunk_size].to_dict('records'):
+            yield convert_dict_fields_to_str(record)
 
 
-def avro_dumps(data, schema):
-    """dump the given data into an avro file with the provided schema"""
-    schema = avro.schema.Parse(schema)
+def estimate_avro_size(df):
+    """Estimate the size in bytes of ``df`` once encoded by ``dataframe_to_avro_bytes``.
+
+    Object columns are measured by the length of their strings, so the estimate reflects their contents
+    rather than the size of the pointers to them. The estimate never exceeds the encoded size.
+    """
+    size = 0
+    for field in df.columns:
+        column = df[field]
+        if np.issubdtype(column.dtype, np.floating):
+            size += 8 * len(column)
+        elif np.issubdtype(column.dtype, np.number):
+            size += len(column)
+        elif np.issubdtype(column.dtype, np.datetime64):
+            size += (len('YYYY-MM-DD HH:MM:SS') + 1) * len(column)
+        elif np.issubdtype(column.dtype, np.object_) and pd.api.types.infer_dtype(column) == 'string':
+            size += int(column.str.len().sum()) + len(column)
+        else:
+            size += len(column)
+    return size
+
+
+def dataframe_to_avro(fp, df, name, namespace, max_size=None):
+    """Write ``df`` into ``fp`` as an avro file
+
+    :param max_size: (optional, int) abort with a ``DataTooLargeError`` as soon as the output exceeds this many bytes
+    """
+    schema = json.dumps(dataframe_avro_schema(df, name, namespace))
+    avro_dump(fp, dataframe_records(df), schema, max_size)
+
+
+def dataframe_to_avro_bytes(df, name, namespace, max_size=None):
+    """Encode ``df`` as an avro file. See ``dataframe_to_avro``"""
     fp = BytesIO()
+    dataframe_to_avro(fp, df, name, namespace, max_size)
+    contents = fp.getvalue()
+    fp.close()
+    return contents
+
+
+def avro_dump(fp, data, schema, max_size=None):
+    """Write the given data into ``fp`` as an avro file with the provided schema.
+
+    Blocks are written to ``fp`` as soon as they fill up. If ``max_size`` is given,
+    a ``DataTooLargeError`` is raised once ``fp`` grows past that many bytes.
+    """
+    schema = avro.schema.Parse(schema)
+    start = fp.tell()
     writer = DataFileWriter(fp, DatumWriter(), schema)
-    if isinstance(data, list):
-        for item in data:
-            writer.append(item)
-    else:
-        writer.append(data)
+    if isinstance(data, dict):
+        data = [data]
+    for item in data:
+        writer.append(item)
+        if max_size is not None and fp.tell() - start > max_size:
+            raise DataTooLargeError('Avro data exceeds {} bytes'.format(max_size))
     writer.flush()
+    if max_size is not None and fp.tell() - start > max_size:
+        raise DataTooLargeError('Avro data exceeds {} bytes'.format(max_size))
+
+
+def avro_dumps(data, schema, max_size=None):
+    """dump the given data into an avro file with the provided schema"""
+    fp = BytesIO()
+    avro_dump(fp, data, schema, max_size)
     contents = fp.getvalue()
     fp.close()
     return contents
 
 
+def dataframe_content_hash(df):
+    """Return a hex digest of the column names, dtypes and values of ``df``, ignoring its index"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps([[str(name), str(dtype)] for name, dtype in df.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def read_dataframe_chunks(path, chunk_size, columns=None, dtypes=None):
+    """Read a local Parquet or CSV file as a sequence of DataFrames
+
+    :param path: (str) path of a ``.parquet``/``.pq`` or ``.csv`` file
+    :param chunk_size: (int) maximum number of rows in each DataFrame
+    :param columns: (optional, list) names of the columns to read. Columns missing from the file are skipped
+    :param dtypes: (optional, dict) column name => dtype to cast the column to
+
+    :return: iterator of pandas.DataFrame
+    :raises: ``DataMonsterError`` if the file type is not supported
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.parquet', '.pq'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise DataMonsterError('pyarrow is required to read Parquet files')
+
+        parquet_file = pq.ParquetFile(path)
+        if columns is not None:
+            columns = [name for name in parquet_file.schema_arrow.names if name in columns]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            chunk = batch.to_pandas()
+            for name, dtype in (dtypes or {}).items():
+                if name in chunk:
+                    column = chunk[name]
+                    # Missing values stay missing, as with read_csv, instead of becoming 'None' strings
+                    chunk[name] = column.astype(dtype).where(column.notna()) if dtype is str else column.astype(dtype)
+            yield chunk
+    elif extension == '.csv':
+        usecols = None if columns is None else (lambda name: name in columns)
+        for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=usecols, dtype=dtypes):
+            yield chunk
+    else:
+        raise DataMonsterError('Unsupported file type {!r}. Please pass a Parquet or CSV file'.format(extension))
+
+
 def convert_dict_fields_to_str(original, preserve_types=[float, int]):
     """Given a dictionary, convert the specified fields to string"""
 
@@ -0,0 +1,105 @@
+"""Memory used per row by decoded data, with and without a ``DtypePolicy``
+
+Run with ``python benchmark_dtypes.py [rows]``. The data is synthetic: a rawdata avro payload with the
+shape of a wide multi-company pull, i.e. a few low cardinality splits repeated over many days.
+"""
+import datetime
+import gc
+import io
+import sys
+import tracemalloc
+
+import fastavro
+
+from datamonster_api import DataMonster, DtypePolicy
+from datamonster_api.lib.decoding import decode_avro
+
+FIELDS = [
+    {"name": "period_start", "data_type": "date"},
+    {"name": "period_end", "data_type": "date"},
+    {"name": "value", "data_type": "number"},
+    {"name": "country", "data_type": "string"},
+    {"name": "category", "data_type": "string"},
+    {"name": "channel", "data_type": "string"},
+]
+
+SCHEMA = {
+    "type": "record",
+    "name": "rawdata",
+    "fields": [
+        {"name": "period_start", "type": "string"},
+        {"name": "period_end", "type": "string"},
+        {"name": "value", "type": "double"},
+        {"name": "country", "type": "string"},
+        {"name": "category", "type": "string"},
+        {"name": "channel", "type": "string"},
+        {"name": "section_pk", "type": "int"},
+    ],
+    "structure": {
+        "lower_date": ["period_start"],
+        "upper_date": ["period_end"],
+        "value": ["value"],
+        "split": ["country", "category", "channel"],
+        "section_pk": ["section_pk"],
+    },
+}
+
+
+def make_payload(rows):
+    start = datetime.date(2015, 1, 1)
+
+    def records():
+        for i in range(rows):
+            day = start + datetime.timedelta(days=i // 2000)
+            yield {
+                "period_start": day.isoformat(),
+                "period_end": (day + datetime.timedelta(days=1)).isoformat(),
+                "value": i * 0.37,
+                "country": "country {}".format(i % 20),
+                "category": "category number {}".format(i % 200),
+                "channel": ("online", "store", "mobile", "catalog", "other")[i % 5],
+                "section_pk": 100 + i % 50,
+            }
+
+    fo = io.BytesIO()
+    fastavro.writer(fo, fastavro.parse_schema(SCHEMA), records())
+    return fo.getvalue()
+
+
+def measure(payload, dtypes, mapped):
+    """
+    :return: (int) bytes held by the decoded DataFrame
+    """
+    gc.collect()
+    tracemalloc.start()
+    schema, df = decode_avro(io.BytesIO(payload), FIELDS)
+    if dtypes is not None:
+        dtypes.apply(df)
+    if mapped:
+        df = DataMonster._datamonster_data_mapper(
+            DataMonster.DATAMONSTER_SCHEMA_FIELDS, schema, df, dtypes is not None and dtypes.intern_dimensions
+        )
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del df
+    return size
+
+
+def main(rows):
+    payload = make_payload(rows)
+    print("{} rows, {} bytes of avro".format(rows, len(payload)))
+
+    policies = [
+        ("default", None),
+        ("DtypePolicy()", DtypePolicy()),
+        ("DtypePolicy(downcast=True)", DtypePolicy(downcast=True)),
+    ]
+    for output, mapped in (("get_data_raw", False), ("get_data", True)):
+        for label, dtypes in policies:
+            size = measure(payload, dtypes, mapped)
+            print("{:<14} {:<28} {:>8.1f} bytes/row".format(output, label, size / float(rows)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
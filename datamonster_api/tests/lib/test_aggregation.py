@@ -1,3 +1,4 @@
+import pandas
 import pytest
 
 from datamonster_api import Aggregation, DataMonsterError
@@ -79,3 +80,80 @@ def test_to_time_aggregation_dictionary_2(company):
     agg = Aggregation(period="fiscalQuarter", company=company)
     agg_dict = agg.to_time_aggregation_dictionary()
     assert agg_dict == expected
+
+
+def _raw_daily_data():
+    schema = {
+        "lower_date": ["period_start"],
+        "upper_date": ["period_end"],
+        "value": ["value"],
+        "split": ["country"],
+        "section_pk": ["section_pk"],
+    }
+    days = pandas.date_range("2019-01-01", "2019-03-31")
+    df = pandas.concat([
+        pandas.DataFrame({
+            "period_start": days,
+            "period_end": days + pandas.Timedelta(days=1),
+            "value": 1.0 if country == "US" else 2.0,
+            "country": country,
+            "section_pk": 1,
+        })
+        for country in ["US", "UK"]
+    ])
+    return schema, df
+
+
+def test_aggregate_month():
+    """Test local aggregation -- calendar months"""
+    schema, df = _raw_daily_data()
+
+    result = Aggregation(period="month", company=None).aggregate(schema, df, "sum")
+    result = result.sort_values(["country", "period_start"]).reset_index(drop=True)
+
+    assert len(result) == 6
+    assert list(result.period_start.dt.month) == [1, 2, 3] * 2
+    assert list(result.period_end.dt.strftime("%Y-%m-%d")) == ["2019-02-01", "2019-03-01", "2019-04-01"] * 2
+    assert list(result.value) == [62.0, 56.0, 62.0, 31.0, 28.0, 31.0]
+
+    result = Aggregation(period="month", company=None).aggregate(schema, df, "mean")
+    assert set(result.value) == {1.0, 2.0}
+
+    with pytest.raises(DataMonsterError):
+        Aggregation(period="month", company=None).aggregate(schema, df, "median")
+
+
+def test_aggregate_drops_incomplete_periods():
+    """Test local aggregation -- the period to date, and periods starting before the data, are dropped"""
+    schema, df = _raw_daily_data()
+
+    result = Aggregation(period="quarter", company=None).aggregate(schema, df[df.period_start < "2019-03-31"], "sum")
+    assert result.empty
+
+    result = Aggregation(period="week", company=None).aggregate(schema, df, "sum")
+    result = result[result.country == "US"].sort_values("period_start")
+    # weeks run from Monday to Sunday: 2019-01-07 to 2019-01-13 is the first complete one,
+    # and 2019-03-25 to 2019-03-31 the last
+    assert result.period_start.iloc[0] == pandas.Timestamp("2019-01-07")
+    assert result.period_end.iloc[-1] == pandas.Timestamp("2019-04-01")
+    assert (result.value == 7.0).all()
+
+    # data starting in the middle of January
+    result = Aggregation(period="month", company=None).aggregate(schema, df[df.period_start >= "2019-01-15"], "sum")
+    result = result[result.country == "US"].sort_values("period_start")
+    assert list(result.period_start.dt.strftime("%Y-%m-%d")) == ["2019-02-01", "2019-03-01"]
+    assert list(result.value) == [28.0, 31.0]
+
+
+def test_aggregate_fiscal_quarter(company):
+    """Test local aggregation -- fiscal quarters of the company"""
+    schema, df = _raw_daily_data()
+    company.set_details({"quarters": ["01-15-2019", "02-14-2019", "03-16-2019", "06-14-2019"]})
+
+    result = Aggregation(period="fiscalQuarter", company=company).aggregate(schema, df, "sum")
+    result = result[result.country == "US"].sort_values("period_start")
+
+    # days up to 2019-01-15 are before the first known quarter; 2019-03-17 onwards is incomplete
+    assert list(result.period_start.dt.strftime("%Y-%m-%d")) == ["2019-01-16", "2019-02-15"]
+    assert list(result.period_end.dt.strftime("%Y-%m-%d")) == ["2019-02-15", "2019-03-17"]
+    assert list(result.value) == [30.0, 30.0]
@@ -0,0 +1,38 @@
+from datamonster_api import CheckpointJournal
+
+
+def test_checkpoint_journal(tmpdir):
+    path = str(tmpdir.join("job.journal"))
+    unit = {"datasource": "abc", "section_pk": [1, 2], "start_date": None}
+
+    journal = CheckpointJournal(path)
+    assert not journal.is_done(unit)
+    journal.mark_done(unit)
+    assert journal.is_done(unit)
+    assert journal.is_done(dict(reversed(list(unit.items()))))
+    assert not journal.is_done(dict(unit, section_pk=[3]))
+
+    # a line cut short when the process died is ignored, and not appended to
+    with open(path, "a") as fp:
+        fp.write('{"key": "12')
+    journal = CheckpointJournal(path)
+    assert len(journal) == 1
+    journal.mark_done(dict(unit, section_pk=[3]))
+
+    journal = CheckpointJournal(path)
+    assert len(journal) == 2
+    assert journal.is_done(dict(unit, section_pk=[3]))
+
+
+def test_checkpoint_journal_plan(tmpdir):
+    path = str(tmpdir.join("job.journal"))
+    job = {"datasource": "abc", "job": "pull"}
+
+    journal = CheckpointJournal(path)
+    assert journal.plan(job, lambda: [[1, 2], [3]]) == [[1, 2], [3]]
+    assert journal.plan(job, lambda: [[0, 1], [2, 3]]) == [[1, 2], [3]]
+    assert journal.plan(dict(job, job="export"), lambda: [[0, 1], [2, 3]]) == [[0, 1], [2, 3]]
+
+    journal = CheckpointJournal(path)
+    assert len(journal) == 0
+    assert journal.plan(job, lambda: [[0, 1], [2, 3]]) == [[1, 2], [3]]
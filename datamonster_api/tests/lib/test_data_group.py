@@ -1,5 +1,8 @@
+import fastavro
 import pandas as pd
-from datamonster_api import DataGroupColumn
+import pytest
+
+from datamonster_api import DataGroupColumn, DataMonsterError
 
 
 def assert_object_matches_data_group(data_group, data_group_obj):
@@ -84,3 +87,179 @@ def test_bad_number_or_string_type_counted_as_missing_and_extra(data_group):
     assert (str(missing[0]) == str(DataGroupColumn('string col', 'string')))
     assert (len(extra) == 1)
     assert (str(extra[0]) == str(DataGroupColumn('string col', 'number')))
+
+
+def test_start_data_refresh_too_large(mocker, data_group):
+    data_group.dm = mocker.Mock()
+    df = pd.DataFrame({
+        'date col': ['2006-06-06'] * 100,
+        'number col': range(100),
+        'string col': ['x' * 1024 * 1024] * 100,
+    })
+
+    with pytest.raises(DataMonsterError) as excinfo:
+        data_group.start_data_refresh(df)
+
+    assert 'Data Too Large' in excinfo.value.args[0]
+    assert data_group.dm.client.post.call_count == 0
+
+
+def test_start_data_refresh(mocker, data_group):
+    data_group.dm = mocker.Mock()
+    data_group.dm._get_data_group_path.return_value = '/rest/v1/data_group/1'
+    df = pd.DataFrame({
+        'date col': ['2006-06-06', '2006-06-07'],
+        'number col': [1, 2],
+        'string col': ['a', 'b'],
+    })
+
+    data_group.start_data_refresh(df)
+
+    assert data_group.dm.client.post.call_count == 1
+    assert data_group.dm.client.post.call_args[0][0] == '/rest/v1/data_group/1/refresh'
+    avro_file = data_group.dm.client.post.call_args[1]['files']['avro_file']
+    assert avro_file.read(4) == b'Obj\x01'
+
+
+def test_non_string_date_column_is_missing(data_group):
+    numeric_date_col = pd.DataFrame([
+        {'date col': 20060606, 'string col': 'a', 'number col': 1},
+        {'date col': 20060607, 'string col': 'b', 'number col': 2},
+    ])
+
+    missing, extra, bad_dates = data_group._validate_schema(numeric_date_col)
+    assert(bad_dates == [])
+    assert(len(missing) == 1)
+    assert(str(missing[0]) == str(DataGroupColumn('date col', 'date')))
+    assert(len(extra) == 1)
+    assert(str(extra[0]) == str(DataGroupColumn('date col', 'number')))
+
+
+def test_each_column_profiled_once(mocker, data_group):
+    from datamonster_api.lib import data_group as data_group_module
+
+    profile = mocker.spy(data_group_module, '_ColumnProfile')
+    df = pd.DataFrame([
+        {'date col': '2006-06-06', 'string col': 'a', 'number col': 1, 'extra col': 'x'},
+        {'date col': '2006-06-07', 'string col': 'b', 'number col': 2, 'extra col': 'y'},
+    ])
+
+    missing, extra, bad_dates = data_group._validate_schema(df)
+    assert(missing == [] and bad_dates == [])
+    assert(len(extra) == 1)
+    assert(profile.call_count == 4)
+
+
+def _posted_records(data_group):
+    avro_file = data_group.dm.client.post.call_args[1]['files']['avro_file']
+    return list(fastavro.reader(avro_file))
+
+
+@pytest.mark.parametrize('extension', ['csv', 'parquet'])
+def test_start_data_refresh_from_file(mocker, tmpdir, data_group, extension):
+    if extension == 'parquet':
+        pytest.importorskip('pyarrow')
+    data_group.dm = mocker.Mock()
+    data_group.dm._get_data_group_path.return_value = '/rest/v1/data_group/1'
+    df = pd.DataFrame({
+        'date col': ['2006-06-06', '2006-06-07', '2006-06-08'],
+        'number col': [1, 2, 3],
+        'string col': ['1', 'b', 'c'],
+        'ignored col': ['x', 'y', 'z'],
+    })
+    path = str(tmpdir.join('upload.{}'.format(extension)))
+    if extension == 'csv':
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+
+    data_group.start_data_refresh_from_file(path, chunk_size=2)
+
+    assert data_group.dm.client.post.call_args[0][0] == '/rest/v1/data_group/1/refresh'
+    assert _posted_records(data_group) == [
+        {'date col': '2006-06-06', 'number col': 1.0, 'string col': '1'},
+        {'date col': '2006-06-07', 'number col': 2.0, 'string col': 'b'},
+        {'date col': '2006-06-08', 'number col': 3.0, 'string col': 'c'},
+    ]
+
+
+def test_start_data_refresh_from_file_bad_chunk(mocker, tmpdir, data_group):
+    data_group.dm = mocker.Mock()
+    path = str(tmpdir.join('upload.csv'))
+    pd.DataFrame({
+        'date col': ['2006-06-06', '2006-06-07', '2006-06-08', '2006-6-9'],
+        'number col': [1, 2, 3, 4],
+        'string col': ['a', 'b', 'c', 'd'],
+    }).to_csv(path, index=False)
+
+    with pytest.raises(DataMonsterError) as excinfo:
+        data_group.start_data_refresh_from_file(path, chunk_size=2)
+
+    assert 'YYYY-MM-DD' in excinfo.value.args[0]
+    assert data_group.dm.client.post.call_count == 0
+
+    with pytest.raises(DataMonsterError):
+        data_group.start_data_refresh_from_file(str(tmpdir.join('upload.json')))
+
+
+def test_wait_for_refresh(mocker, data_group):
+    sleep = mocker.patch('datamonster_api.lib.data_group.time.sleep')
+    data_group.get_current_status = mocker.Mock(side_effect=['processing', 'processing', 'processing', 'success'])
+
+    assert data_group.wait_for_refresh(poll_interval=1, max_poll_interval=3) == 'success'
+    assert [call[0][0] for call in sleep.call_args_list] == [1, 2, 3, 3]
+
+    for poll_interval in (0, -1):
+        with pytest.raises(DataMonsterError):
+            data_group.wait_for_refresh(poll_interval=poll_interval)
+    assert sleep.call_count == 4
+
+
+def test_start_data_refresh_skip_unchanged(mocker, tmpdir, data_group):
+    from datamonster_api import DataMonster
+
+    path = str(tmpdir.join('upload_hashes.json'))
+    data_group.dm = DataMonster('key_id', 'secret', upload_hash_path=path)
+    data_group.dm.client.post = mocker.Mock(return_value={})
+    df = pd.DataFrame({
+        'date col': ['2006-06-06', '2006-06-07'],
+        'number col': [1, 2],
+        'string col': ['a', 'b'],
+    })
+
+    assert data_group.start_data_refresh(df, skip_unchanged=True) == {}
+    assert data_group.start_data_refresh(df.copy(), skip_unchanged=True) is None
+    assert data_group.dm.client.post.call_count == 1
+
+    # the hash is remembered across DataMonster objects through the hash file
+    data_group.dm = DataMonster('key_id', 'secret', upload_hash_path=path)
+    data_group.dm.client.post = mocker.Mock(return_value={})
+    assert data_group.start_data_refresh(df, skip_unchanged=True) is None
+
+    changed = df.assign(**{'number col': [1, 3]})
+    assert data_group.start_data_refresh(changed, skip_unchanged=True) == {}
+    assert data_group.dm.client.post.call_count == 1
+
+    # a failed refresh is forgotten so the same data can be sent again
+    data_group.dm.client.get = mocker.Mock(return_value={'_id': data_group.id, 'status': 'error'})
+    data_group.get_current_status()
+    assert data_group.start_data_refresh(changed, skip_unchanged=True) == {}
+    assert data_group.dm.client.post.call_count == 2
+
+
+def test_start_data_refresh_datetime_dates(mocker, data_group):
+    data_group.dm = mocker.Mock()
+    df = pd.DataFrame({
+        'date col': pd.to_datetime(['2006-06-06', '2006-06-07']),
+        'number col': [1, 2],
+        'string col': ['a', 'b'],
+    })
+
+    data_group.start_data_refresh(df)
+
+    assert [record['date col'] for record in _posted_records(data_group)] == ['2006-06-06', '2006-06-07']
+
+    data_group.dm.reset_mock()
+    data_group.start_data_refresh(df.assign(**{'date col': pd.date_range('2006-06-06', periods=2, tz='UTC')}))
+
+    assert [record['date col'] for record in _posted_records(data_group)] == ['2006-06-06', '2006-06-07']
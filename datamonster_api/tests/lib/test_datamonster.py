@@ -1,8 +1,14 @@
 import datetime
+import fastavro
+import io
+import os
 import pandas
 import pytest
 
-from datamonster_api import Aggregation, DataMonsterError, DataMonster, DataGroupColumn
+from datamonster_api import (
+    Aggregation, CheckpointJournal, Company, DataMonsterError, DataMonster, DataGroupColumn, DtypePolicy, LocalStore,
+    RowFilter,
+)
 from test_data_group import assert_object_matches_data_group
 
 
@@ -252,6 +258,116 @@ def test_get_data_raw_2(mocker, dm, avro_data_file, company, datasource, datasou
     assert df.iloc[7]["period_end"].date() == datetime.date(2019, 1, 3)
 
 
+def test_get_data_raw_row_filter(mocker, dm, avro_data_file, company, datasource, datasource_details_result):
+    """Test getting raw data -- rows filtered while decoding"""
+
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=avro_data_file)
+
+    schema, full = dm.get_data_raw(datasource)
+
+    row_filter = RowFilter(start_date=datetime.date(2019, 1, 2))
+    schema, df = dm.get_data_raw(datasource, row_filter=row_filter)
+    assert len(df) == 4
+    assert (df.period_start.dt.date == datetime.date(2019, 1, 2)).all()
+
+    row_filter = RowFilter(end_date=datetime.date(2019, 1, 1), equals={"category": ["Whole Foods", "Nope"]})
+    schema, df = dm.get_data_raw(datasource, row_filter=row_filter)
+    assert len(df) == 1
+    assert df.iloc[0]["avg_dollar_per_cust"] == 52.6278787878788
+
+    schema, df = dm.get_data_raw(datasource, row_filter=row_filter, decode_processes=2)
+    assert len(df) == 1
+
+    schema, df = dm.get_data_raw(datasource, row_filter=RowFilter(equals={"country": "CA"}))
+    assert len(df) == 0
+    assert list(df.columns) == list(full.columns)
+
+
+def test_get_data_raw_columns(mocker, dm, avro_data_file, company, datasource, datasource_details_result):
+    """Test getting raw data -- only some of the columns"""
+
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=avro_data_file)
+
+    schema, df = dm.get_data_raw(datasource, columns=["category", "avg_dollar_per_cust"])
+    assert list(df.columns) == ["avg_dollar_per_cust", "category"]
+    assert len(df) == 8
+    assert df.iloc[0]["category"] == "Amazon ex. Whole Foods"
+
+    schema, df = dm.get_data_raw(
+        datasource, columns=["period_start"], row_filter=RowFilter(equals={"category": "Whole Foods"})
+    )
+    assert list(df.columns) == ["period_start"]
+    assert len(df) == 2
+
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw(datasource, columns=["category", "section"])
+
+    df = dm.get_data(datasource, company, columns=["category"])
+    assert len(df) == 8
+    assert all(list(dimensions) == ["category"] for dimensions in df.dimensions)
+    assert sorted(df.columns) == ["dimensions", "end_date", "start_date", "time_span", "value"]
+
+
+def test_get_data_arrow(mocker, tmpdir, dm, other_avro_data_file, company, datasource, datasource_details_result):
+    """Test getting data -- as Arrow tables"""
+    pyarrow = pytest.importorskip('pyarrow')
+
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+
+    schema, df = dm.get_data_raw(datasource)
+    schema, table = dm.get_data_raw(datasource, output="arrow")
+    assert isinstance(table, pyarrow.Table)
+    assert pyarrow.types.is_dictionary(table.schema.field("category").type)
+    assert table.to_pandas().astype({"country": object, "category": object}).equals(df)
+
+    start_date, end_date = datetime.date(2019, 1, 1), datetime.date(2019, 6, 30)
+    df = dm.get_data(datasource, company, start_date=start_date, end_date=end_date)
+    table = dm.get_data(datasource, company, start_date=start_date, end_date=end_date, output="arrow")
+    assert table.column_names == list(df.columns)
+    assert table.num_rows == len(df) > 0
+    assert table["dimensions"].to_pylist() == list(df.dimensions)
+    for name in ("start_date", "end_date", "time_span", "value"):
+        assert list(table[name].to_pandas()) == list(df[name])
+
+    # no split kept: the dimensions can still be written to Parquet
+    table = dm.get_data(datasource, company, start_date=start_date, end_date=end_date, output="arrow", columns=[])
+    assert table.column("dimensions").null_count == table.num_rows > 0
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    path = str(tmpdir.join("data.parquet"))
+    pyarrow_parquet.write_table(table, path)
+    assert pyarrow_parquet.read_table(path).num_rows == table.num_rows
+
+    with pytest.raises(DataMonsterError):
+        dm.get_data(datasource, company, output="arrow", incremental=True)
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw(datasource, output="polars")
+
+
+def test_get_data_dtypes(mocker, dm, other_avro_data_file, company, datasource, datasource_details_result):
+    """Test getting data -- memory saving dtypes"""
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+
+    schema, df = dm.get_data_raw(datasource)
+    schema, compact = dm.get_data_raw(datasource, dtypes=DtypePolicy(downcast=True))
+    assert compact["category"].dtype.name == "category"
+    assert compact["avg_dollar_per_cust"].dtype == "float32"
+    assert compact.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum() / 4
+    assert list(compact["category"].astype(object)) == list(df["category"])
+
+    df = dm.get_data(datasource, company)
+    compact = dm.get_data(datasource, company, dtypes=DtypePolicy())
+    assert list(compact.dimensions) == list(df.dimensions)
+    assert compact.dimensions.iloc[0] is compact.dimensions.iloc[-1]
+    assert compact.value.equals(df.value)
+
+    with pytest.raises(DataMonsterError):
+        dm.get_data(datasource, company, dtypes=DtypePolicy(), output="arrow")
+
+
 def test_get_data_1(
     mocker, dm, avro_data_file, company, datasource, datasource_details_result
 ):
@@ -401,6 +517,23 @@ def test_get_data_4(mocker, dm, other_avro_data_file, company, datasource, datas
     assert df.iloc[0].start_date.date() == datetime.date(2014, 1, 15)
     assert df.iloc[1].start_date.date() == datetime.date(2014, 1, 16)
 
+    # ** dimensions
+    df = dm.get_data(
+        datasource, company, start_date=datetime.date(2019, 12, 30), dimensions={"category": "Apple iTunes"}
+    )
+    assert len(df) == 2
+    df = dm.get_data(datasource, company, dimensions={"country": ["CA", "UK"]})
+    assert len(df) == 0
+    assert dm.client.post.call_args[0][1]["filters"] == {"section_pk": [int(company.id)], "country": ["CA", "UK"]}
+
+    # a misspelled split fails rather than returning no rows, and the company can not be overridden
+    with pytest.raises(DataMonsterError):
+        dm.get_data(datasource, company, dimensions={"Country": "US"})
+    dm.client.post.reset_mock()
+    with pytest.raises(DataMonsterError):
+        dm.get_data(datasource, company, dimensions={"section_pk": 2})
+    assert dm.client.post.call_count == 0
+
 
 def test_get_data_group_by_id(mocker, dm, data_group_details_result):
     """Test getting data group by pk"""
@@ -449,3 +582,566 @@ def test_get_data_groups(mocker, dm, single_page_data_group_results):
     assert_results_good(data_groups)
     assert dm.client.get.call_count == 1
     assert dm.client.get.call_args[0][0] == "/rest/v1/data_group?q=test"
+
+
+@pytest.mark.parametrize('encode_processes', [None, 2])
+def test_refresh_data_groups(mocker, dm, single_page_data_group_results, encode_processes):
+    """Test refreshing several data groups concurrently"""
+    groups = [dm._data_group_result_to_object(dg) for dg in single_page_data_group_results['results']]
+    ok, failing = groups
+    sleep = mocker.patch('datamonster_api.lib.data_group.time.sleep')
+    dm.client.post = mocker.Mock(return_value={})
+    ok.get_current_status = mocker.Mock(side_effect=['processing', 'success'])
+    failing.get_current_status = mocker.Mock()
+
+    results = dm.refresh_data_groups(
+        {
+            ok: pandas.DataFrame({'end date': ['2019-01-01', '2019-01-02']}),
+            failing: pandas.DataFrame({'Start Date': ['2019-01-01']}),
+        },
+        poll_interval=2,
+        encode_processes=encode_processes,
+    )
+
+    assert dm.client.post.call_count == 1
+    assert dm.client.post.call_args[0][0] == '/rest/v1/data_group/123/refresh'
+    assert results[ok]['status'] == 'success'
+    assert results[ok]['error'] is None
+    assert results[ok]['encode_time'] >= 0
+    assert results[ok]['upload_time'] >= 0
+    assert results[ok]['total_time'] >= results[ok]['processing_time'] >= 0
+    assert ok.get_current_status.call_count == 2
+    assert [call[0][0] for call in sleep.call_args_list] == [2, 4]
+
+    assert results[failing]['status'] == 'error'
+    assert isinstance(results[failing]['error'], DataMonsterError)
+    assert results[failing]['processing_time'] is None
+    assert failing.get_current_status.call_count == 0
+
+    with pytest.raises(DataMonsterError):
+        dm.refresh_data_groups({ok: pandas.DataFrame({'end date': ['2019-01-01']})}, poll_interval=0)
+    assert dm.client.post.call_count == 1
+
+
+def test_get_data_aggregations(mocker, dm, other_avro_data_file, company, datasource, datasource_details_result):
+    """Test getting several aggregations of the data with a single request"""
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    company.set_details({"quarters": ["03-31-2019", "06-30-2019", "09-30-2019", "12-31-2019"]})
+
+    results = dm.get_data_aggregations(
+        datasource, company, ["week", "month", "quarter", "fiscalQuarter"], start_date=datetime.date(2019, 1, 1)
+    )
+
+    assert dm.client.post.call_count == 1
+    assert dm.client.post.call_args[0][1]['timeAggregation'] is None
+    assert sorted(results) == ["fiscalQuarter", "month", "quarter", "week"]
+
+    monthly = results["month"]
+    assert sorted(monthly.columns) == ["dimensions", "end_date", "start_date", "time_span", "value"]
+    assert len(monthly) == 12
+    assert monthly.iloc[0]["start_date"].date() == datetime.date(2019, 1, 1)
+    assert monthly.iloc[0]["end_date"].date() == datetime.date(2019, 1, 31)
+    assert monthly.iloc[0]["time_span"].to_pytimedelta() == datetime.timedelta(days=31)
+    assert monthly.iloc[0]["dimensions"] == {"category": "Apple iTunes", "country": "US"}
+
+    daily = dm.get_data(datasource, company)
+    january = daily[(daily.start_date >= "2019-01-01") & (daily.start_date <= "2019-01-31")]
+    assert monthly.iloc[0]["value"] == pytest.approx(january.value.sum())
+
+    assert len(results["quarter"]) == 4
+    assert len(results["fiscalQuarter"]) == 3
+
+
+def test_get_data_incremental(mocker, dm, other_avro_data_file, company, datasource, datasource_details_result):
+    """Test getting data -- incremental updates of the data held"""
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+
+    full = dm.get_data(datasource, company)
+    df = dm.get_data(datasource, company, incremental=True)
+    assert list(df.value) == list(full.value)
+    assert list(df.end_date) == list(full.end_date)
+
+    # Mark the rows held, to tell them apart from the rows fetched again
+    cached, = dm._data_cache.values()
+    cached["value"] = -1.0
+    latest = cached.end_date.max()
+
+    df = dm.get_data(datasource, company, incremental=True, lookback=datetime.timedelta(days=2))
+    assert len(df) == len(full)
+    refetched = df.end_date >= latest - datetime.timedelta(days=2)
+    assert refetched.sum() == 3
+    assert (df.value[~refetched] == -1.0).all()
+    assert list(df.value[refetched]) == list(full.value[full.end_date >= latest - datetime.timedelta(days=2)])
+
+    df = dm.get_data(datasource, company, incremental=True, start_date=datetime.date(2019, 12, 30))
+    assert len(df) == 2
+
+    # Other dimensions are cached apart
+    df = dm.get_data(datasource, company, incremental=True, dimensions={"category": "Nope"})
+    assert len(df) == 0
+    assert len(dm._data_cache) == 2
+
+    dm.clear_data_cache()
+    assert dm._data_cache == {}
+
+
+def test_get_data_raw_sharded(
+    mocker, dm, other_avro_data_file, company, other_company, datasource, datasource_details_result
+):
+    """Test getting raw data in shards of companies"""
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.shard_retry_wait = 0
+
+    failed = []
+
+    def post(path, post_data, headers, stream=False):
+        shard = post_data["filters"]["section_pk"]
+        if shard == [5] and not failed:
+            failed.append(shard)
+            raise DataMonsterError("Gateway Timeout")
+        return other_avro_data_file
+
+    dm.client.post = mocker.Mock(side_effect=post)
+    filters = {"section_pk": [1, 2, 3, 4, 5], "category": ["Apple iTunes"]}
+
+    shards = list(dm.iter_data_raw_shards(datasource, filters, shard_size=2, max_workers=2))
+    assert sorted(shard for shard, _, _ in shards) == [[1, 2], [3, 4], [5]]
+    assert all(len(df) == 2191 for _, _, df in shards)
+    assert failed == [[5]]
+    assert dm.client.post.call_count == 4
+    assert all(call[0][1]["filters"]["category"] == ["Apple iTunes"] for call in dm.client.post.call_args_list)
+
+    # all the companies of the data source, by default
+    dm.get_companies = mocker.Mock(return_value=iter([company, other_company]))
+    schema, df = dm.get_data_raw_sharded(datasource, shard_size=1, dtypes=DtypePolicy())
+    assert dm.get_companies.call_args[1] == {"datasource": datasource}
+    assert len(df) == 2 * 2191
+    assert df["category"].dtype.name == "category"
+    assert schema["split"] == ["country", "category"]
+
+    # a shard failing on every retry fails the pull
+    dm.client.post = mocker.Mock(side_effect=DataMonsterError("Gateway Timeout"))
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw_sharded(datasource, filters, shard_size=2, retries=1)
+    assert dm.client.post.call_count >= 2
+
+
+def test_export_datasource(mocker, tmpdir, dm, other_avro_data_file, datasource, datasource_details_result):
+    """Test exporting a data source to a partitioned Parquet dataset"""
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    path = str(tmpdir.join("export"))
+
+    stats = dm.export_datasource(
+        datasource, path, partition_by=["country"], filters={"section_pk": [1, 2, 3]}, shard_size=1,
+        max_workers=2, chunk_size=1000, max_pending=1,
+    )
+    assert stats == {"shards": 3, "chunks": 9, "rows": 3 * 2191, "skipped": 0}
+    assert tmpdir.join("export", "country=US").check(dir=True)
+    assert len(tmpdir.join("export", "country=US").listdir()) == 9
+
+    table = pq.read_table(path)
+    assert table.num_rows == 3 * 2191
+    schema, df = dm.get_data_raw(datasource)
+    assert sorted(table.column("avg_dollar_per_cust").to_pylist()) == sorted(list(df.avg_dollar_per_cust) * 3)
+
+    dm.shard_retry_wait = 0
+    dm.client.post = mocker.Mock(side_effect=DataMonsterError("Gateway Timeout"))
+    with pytest.raises(DataMonsterError):
+        dm.export_datasource(datasource, path, filters={"section_pk": [1, 2, 3]}, shard_size=1, retries=1)
+
+
+def test_export_datasource_checkpoint(mocker, tmpdir, dm, other_avro_data_file, datasource, datasource_details_result):
+    """Test resuming an export that failed halfway through"""
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.shard_retry_wait = 0
+    path = str(tmpdir.join("export"))
+    checkpoint = str(tmpdir.join("export.journal"))
+    filters = {"section_pk": [1, 2, 3]}
+
+    def post(path, post_data, headers, stream=False):
+        if post_data["filters"]["section_pk"] == [3]:
+            raise DataMonsterError("Gateway Timeout")
+        return other_avro_data_file
+
+    dm.client.post = mocker.Mock(side_effect=post)
+    with pytest.raises(DataMonsterError):
+        dm.export_datasource(datasource, path, filters=filters, shard_size=1, max_workers=1, retries=0,
+                             checkpoint=checkpoint)
+    assert len(CheckpointJournal(checkpoint)) == 2
+
+    # a file left by the shard that failed is replaced
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    unit = dict(dm._shard_job("export", datasource, filters, None, None, None, path, None), section_pk=[3])
+    stale = tmpdir.join("export", "part-{}-5-0.parquet".format(CheckpointJournal.unit_key(unit)[:16]))
+    stale.write("")
+
+    fsync_files = mocker.spy(dm, "_fsync_files")
+    stats = dm.export_datasource(datasource, path, filters=filters, shard_size=1, checkpoint=checkpoint)
+    assert stats == {"shards": 1, "chunks": 1, "rows": 2191, "skipped": 2}
+    assert dm.client.post.call_count == 1
+    assert [os.path.basename(name) for name in fsync_files.call_args[0][0]] == [
+        "part-{}-0-0.parquet".format(CheckpointJournal.unit_key(unit)[:16])
+    ]
+    assert dm.client.post.call_args[0][1]["filters"]["section_pk"] == [3]
+    assert not stale.check()
+    assert pq.read_table(path).num_rows == 3 * 2191
+
+    stats = dm.export_datasource(datasource, path, filters=filters, shard_size=1, checkpoint=checkpoint)
+    assert stats == {"shards": 0, "chunks": 0, "rows": 0, "skipped": 3}
+
+    # the same journal does not skip the shards of a pull, or of an export elsewhere
+    assert len(list(dm.iter_data_raw_shards(datasource, filters, shard_size=1, checkpoint=checkpoint))) == 3
+    other_path = str(tmpdir.join("other_export"))
+    stats = dm.export_datasource(datasource, other_path, filters=filters, shard_size=1, checkpoint=checkpoint)
+    assert stats == {"shards": 3, "chunks": 3, "rows": 3 * 2191, "skipped": 0}
+
+
+def test_iter_data_raw_shards_checkpoint(
+    mocker, tmpdir, dm, other_avro_data_file, datasource, datasource_details_result
+):
+    """Test skipping the shards consumed by an earlier pull"""
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    checkpoint = CheckpointJournal(str(tmpdir.join("pull.journal")))
+    filters = {"section_pk": [1, 2, 3, 4]}
+
+    shards = dm.iter_data_raw_shards(datasource, filters, shard_size=1, max_workers=1, checkpoint=checkpoint)
+    first, _, _ = next(shards)
+    assert len(checkpoint) == 0
+    next(shards)
+    shards.close()
+    assert len(checkpoint) == 1
+
+    remaining = [shard for shard, _, _ in dm.iter_data_raw_shards(
+        datasource, filters, shard_size=1, checkpoint=str(tmpdir.join("pull.journal"))
+    )]
+    assert sorted(remaining) == sorted([pk] for pk in [1, 2, 3, 4] if [pk] != first)
+
+    # the shards planned by the first run are kept, even if the companies of the data source change
+    checkpoint = CheckpointJournal(str(tmpdir.join("companies.journal")))
+    dm.get_companies = mocker.Mock(return_value=iter([Company(pk, "", "", "", None) for pk in (1, 2, 3)]))
+    shards = dm.iter_data_raw_shards(datasource, shard_size=2, max_workers=1, checkpoint=checkpoint)
+    next(shards)
+    next(shards)
+    shards.close()
+
+    dm.get_companies = mocker.Mock(return_value=iter([Company(pk, "", "", "", None) for pk in (0, 1, 2, 3)]))
+    remaining = [shard for shard, _, _ in dm.iter_data_raw_shards(datasource, shard_size=2, checkpoint=checkpoint)]
+    assert remaining == [[3]]
+    assert dm.get_companies.call_count == 0
+
+
+def test_get_data_local_store(mocker, tmpdir, dm, other_avro_data_file, company, datasource, datasource_details_result):
+    """Test getting data through a local store"""
+    pyarrow = pytest.importorskip('pyarrow')
+
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    start_date = datetime.date(2019, 1, 1)
+    expected = dm.get_data(datasource, company, start_date=start_date)
+
+    dm.local_store = LocalStore(str(tmpdir.join("store")))
+    df = dm.get_data(datasource, company, start_date=start_date)
+    assert dm.client.post.call_count == 2
+    assert list(df.columns) == list(expected.columns)
+    for name in ("start_date", "end_date", "time_span", "value", "dimensions"):
+        assert list(df[name]) == list(expected[name])
+
+    # other processes read the data from the store, memory-mapped
+    other_dm = DataMonster("key_id", "secret", local_store=LocalStore(str(tmpdir.join("store"))))
+    other_dm.client.post = mocker.Mock(side_effect=DataMonsterError("not expected"))
+    allocated = pyarrow.total_allocated_bytes()
+    table = other_dm.get_data(datasource, company, output="arrow")
+    assert pyarrow.total_allocated_bytes() == allocated
+    assert table.num_rows == 2191
+
+    dm.get_data(datasource, company, dimensions={"category": "Apple iTunes"})
+    assert dm.client.post.call_count == 3
+
+    # clients of other users or servers do not share the data
+    for other_dm in (
+        DataMonster("other_key_id", "secret", local_store=dm.local_store),
+        DataMonster("key_id", "secret", server="https://staging.example.com", local_store=dm.local_store),
+    ):
+        other_dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+        other_dm.get_data(datasource, company)
+        assert other_dm.client.post.call_count == 1
+
+    with pytest.raises(DataMonsterError):
+        dm.get_data(datasource, company, decode_processes=2)
+    assert dm.client.post.call_count == 3
+
+
+def test_get_data_check_coverage(
+    mocker, dm, other_avro_data_file, company, datasource, datasource_details_result, single_page_dimensions_result
+):
+    """Test skipping requests that the dimension metadata shows can not return rows"""
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.get = mocker.Mock(return_value=single_page_dimensions_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+
+    df = dm.get_data(datasource, company, start_date=datetime.date(2019, 6, 1), check_coverage=True)
+    assert dm.client.post.call_count == 0
+    assert df.empty
+    assert list(df.columns) == [col["name"] for col in datasource.fields]
+
+    df = dm.get_data(datasource, company, start_date=datetime.date(2018, 6, 1), check_coverage=True)
+    assert dm.client.post.call_count == 1
+    assert len(df) > 0
+
+    # the dimension metadata is reused
+    assert dm.client.get.call_count == 1
+    dm.coverage_max_age = 0
+    dm.get_data(datasource, company, check_coverage=True)
+    assert dm.client.get.call_count == 2
+
+    # shards of companies with rows, planned by size
+    dm.client.post.reset_mock()
+    shards = list(dm.iter_data_raw_shards(
+        datasource, {"section_pk": [1, 2, 3, 4]}, row_filter=RowFilter(start_date="2019-01-15"), shard_rows=5
+    ))
+    assert [shard for shard, _, _ in shards] == [[3]]
+    assert dm.client.post.call_count == 1
+
+
+def test_estimate_rows_first_page(mocker, dm, datasource, multi_page_dimensions_results):
+    """Test that the estimate only reads the first page of the dimensions"""
+    dm.client.get = mocker.Mock(side_effect=multi_page_dimensions_results)
+    row_count = multi_page_dimensions_results[0]["rowCount"]
+
+    assert dm.estimate_rows(datasource, {"category": ["neat"]}) == row_count
+    assert dm.estimate_rows(datasource, {"category": ["neat"]}) == row_count
+    assert dm.client.get.call_count == 1
+
+
+def test_get_data_raw_strategy(
+    mocker, dm, other_avro_data_file, company, other_company, datasource, datasource_details_result,
+    single_page_dimensions_result
+):
+    """Test fetching raw data buffered, streamed, sharded, or as the expected number of rows fits"""
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    filters = {"section_pk": [1]}
+
+    schema, df = dm.get_data_raw(datasource, filters)
+    streamed_schema, streamed = dm.get_data_raw(datasource, filters, strategy="streamed")
+    assert streamed_schema == schema
+    assert streamed.equals(df)
+
+    # estimated from the dimensions, reused for coverage_max_age, falling back to the rows last fetched
+    dm.client.get = mocker.Mock(return_value=single_page_dimensions_result)
+    assert dm.estimate_rows(datasource, filters) == 30
+    assert dm.fetch_strategy(datasource, filters) == "buffered"
+    assert dm.client.get.call_count == 1
+    dm.buffered_max_rows = 10
+    assert dm.fetch_strategy(datasource, filters) == "streamed"
+    dm.sharded_min_rows = 20
+    assert dm.fetch_strategy(datasource, filters) == "streamed"
+    assert dm.fetch_strategy(datasource) == "sharded"
+    assert dm.fetch_strategy(datasource, output="arrow") == "streamed"
+
+    dm.client.get = mocker.Mock(side_effect=DataMonsterError("Bad Gateway"))
+    assert dm.estimate_rows(datasource, filters) == 30
+    dm.coverage_max_age = 0
+    assert dm.estimate_rows(datasource, filters) == 2191
+    assert dm.estimate_rows(datasource, {"section_pk": [2]}) is None
+    assert dm.fetch_strategy(datasource, {"section_pk": [2]}) == "streamed"
+
+    dm.client.get = mocker.Mock(return_value=single_page_dimensions_result)
+    dm.get_companies = mocker.Mock(return_value=iter([company, other_company]))
+    dm.client.post.reset_mock()
+    schema, sharded = dm.get_data_raw(datasource, strategy="auto")
+    assert dm.client.post.call_count == 1
+    assert dm.client.post.call_args[0][1]["filters"]["section_pk"] == [1, 2]
+    assert sharded.equals(df)
+
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw(datasource, filters, strategy="fast")
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw(datasource, filters, strategy="streamed", decode_processes=2)
+    # decode_processes is checked against the strategy picked
+    dm.client.post.reset_mock()
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw(datasource, strategy="auto", decode_processes=2)
+    assert dm.client.post.call_count == 0
+    dm.buffered_max_rows = 200000
+    schema, buffered = dm.get_data_raw(datasource, filters, strategy="auto", decode_processes=2)
+    assert buffered.equals(df)
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw(datasource, filters, output="arrow", strategy="sharded")
+
+
+def test_get_data_limit(mocker, dm, other_avro_data_file, company, datasource, datasource_details_result):
+    """Test previewing data without reading the whole response"""
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    schema, expected = dm.get_data_raw(datasource)
+
+    class StreamedResponse(object):
+        def __init__(self, content):
+            self.raw = io.BytesIO(content)
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    resp = StreamedResponse(other_avro_data_file.content)
+    dm.client.post = mocker.Mock(return_value=resp)
+    schema, df = dm.get_data_raw(datasource, limit=10)
+    assert df.equals(expected.head(10))
+    assert resp.closed
+    assert resp.raw.tell() < len(other_avro_data_file.content) / 2
+
+    dm.client.post = mocker.Mock(return_value=StreamedResponse(other_avro_data_file.content))
+    df = dm.get_data(datasource, company, limit=300, dimensions={"category": "Apple iTunes"})
+    assert len(df) == 300
+    assert all(dimensions["category"] == "Apple iTunes" for dimensions in df.dimensions)
+
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    schema, df = dm.get_data_raw(datasource, limit=0)
+    assert df.empty
+    with pytest.raises(DataMonsterError):
+        dm.get_data(datasource, company, limit=10, incremental=True)
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw(datasource, limit=10, decode_processes=2)
+
+
+def test_get_data_raw_bytes(mocker, tmpdir, dm, other_avro_data_file, datasource, datasource_details_result):
+    """Test writing the avro data of the response without decoding it"""
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=other_avro_data_file)
+    dm.raw_bytes_chunk_size = 1000
+    content = other_avro_data_file.content
+
+    assert dm.get_data_raw_bytes(datasource, {"section_pk": [1]}) == content
+    assert dm.client.post.call_args[0][1]["filters"] == {"section_pk": [1]}
+
+    buffer = io.BytesIO()
+    assert dm.get_data_raw_bytes(datasource, dest=buffer) == len(content)
+    assert buffer.getvalue() == content
+
+    path = str(tmpdir.join("snapshot.avro"))
+    assert dm.get_data_raw_bytes(datasource, dest=path) == len(content)
+    with open(path, "rb") as fp:
+        assert fp.read() == content
+
+    # nothing is left behind by a failed download
+    dm.client.post = mocker.Mock(side_effect=DataMonsterError("Gateway Timeout"))
+    with pytest.raises(DataMonsterError):
+        dm.get_data_raw_bytes(datasource, dest=str(tmpdir.join("failed.avro")))
+    assert tmpdir.listdir() == [tmpdir.join("snapshot.avro")]
+
+
+def test_get_panel(mocker, dm, avro_data_file, company, other_company, datasource, datasource_details_result):
+    """Test getting data as a dates x companies panel"""
+    datasource.get_details = mocker.Mock(return_value=datasource_details_result)
+    dm.client.post = mocker.Mock(return_value=avro_data_file)
+    df = dm.get_data(datasource, company)
+
+    panel = dm.get_panel(datasource, [company], dimensions={"category": "Whole Foods"})
+    assert dm.client.post.call_args[0][1]["filters"] == {"section_pk": [1], "category": ["Whole Foods"]}
+    assert list(panel.columns) == [335]
+    assert panel.index.name == "end_date"
+    expected = df[[dimensions["category"] == "Whole Foods" for dimensions in df.dimensions]]
+    assert list(panel.index) == list(expected.end_date)
+    assert list(panel[335]) == list(expected.value)
+
+    panel = dm.get_panel(datasource, [company], splits=["category"], start_date=datetime.date(2018, 1, 1))
+    assert panel.columns.names == ["section_pk", "category"]
+    assert len(panel.columns) == 4
+    assert panel.notna().sum().sum() == len(df[df.end_date >= pandas.Timestamp(2018, 1, 1)])
+    assert panel.loc[expected.end_date.iloc[-1], (335, "Whole Foods")] == expected.value.iloc[-1]
+
+    sparse = dm.get_panel(datasource, [company], splits=["category"], start_date=datetime.date(2018, 1, 1),
+                          sparse=True)
+    assert all(isinstance(dtype, pandas.SparseDtype) for dtype in sparse.dtypes)
+    assert sparse.sparse.to_dense().equals(panel)
+
+    with pytest.raises(DataMonsterError):
+        dm.get_panel(datasource, [company])
+
+    panel = dm.get_panel(datasource, [company], dimensions={"category": "Nope"})
+    assert panel.empty
+
+    # each company can only be aggregated by its own fiscal quarters
+    dm.client.post.reset_mock()
+    with pytest.raises(DataMonsterError):
+        dm.get_panel(datasource, [company, other_company], aggregation=Aggregation("fiscalQuarter", company))
+    assert dm.client.post.call_count == 0
+
+
+def test_pivot_panel_missing_splits():
+    """Test that rows missing a split value get a column of their own, sorted last"""
+    end_dates = pandas.Series(pandas.to_datetime(["2019-01-02", "2019-01-01", "2019-01-01", "2019-01-01"]))
+    values = pandas.Series([1.0, 2.0, 3.0, 4.0])
+    keys = pandas.DataFrame({"section_pk": [2, 2, 1, 2], "country": ["US", None, "US", "US"]})
+
+    panel = DataMonster._pivot_panel(end_dates, values, keys, sparse=False)
+    assert panel.columns.names == ["section_pk", "country"]
+    assert [str(column) for column in panel.columns] == ["(1, 'US')", "(2, 'US')", "(2, nan)"]
+    assert panel.fillna(0).values.tolist() == [[3.0, 4.0, 2.0], [0.0, 1.0, 0.0]]
+
+
+def test_get_aligned(
+    mocker, dm, other_avro_data_file, company, other_company, datasource, other_datasource, datasource_details_result
+):
+    """Test aligning the data of several data sources on the calendar of the first one"""
+    for ds in (datasource, other_datasource):
+        ds.get_details = mocker.Mock(return_value=datasource_details_result)
+
+    # weekly data for the same company: every 7th daily row, as a week
+    reader = fastavro.reader(io.BytesIO(other_avro_data_file.content))
+    schema = reader.writer_schema
+    weekly_records = []
+    for i, record in enumerate(sorted(reader, key=lambda record: record["period_end"])):
+        if i % 7 == 6:
+            start = pandas.Timestamp(record["period_end"]).date() - datetime.timedelta(days=7)
+            weekly_records.append(dict(record, period_start=start.isoformat(), avg_dollar_per_cust=float(i)))
+    weekly = io.BytesIO()
+    fastavro.writer(weekly, schema, weekly_records)
+
+    def post(path, post_data, headers, stream=False):
+        if path == dm.rawdata_path.format(other_datasource.id):
+            return mocker.Mock(raw=None, content=weekly.getvalue())
+        return other_avro_data_file
+
+    dm.client.post = mocker.Mock(side_effect=post)
+    daily = dm.get_data(datasource, company)
+
+    aligned = dm.get_aligned({"daily": datasource, "weekly": other_datasource}, [company])
+    assert list(aligned.columns) == [
+        "section_pk", "start_date", "end_date", "time_span", "daily", "weekly", "weekly_end_date"
+    ]
+    assert list(aligned.end_date) == list(daily.end_date)
+    assert list(aligned.daily) == list(daily.value)
+    assert aligned.weekly.isna().sum() == 6
+    assert (aligned.weekly_end_date.dropna() <= aligned.end_date[aligned.weekly.notna()]).all()
+    assert (aligned.end_date - aligned.weekly_end_date).max() == pandas.Timedelta(days=6)
+    # each week's value is carried over the days until the next week
+    assert aligned.weekly.iloc[6] == aligned.weekly.iloc[12] == 6.0
+    assert aligned.weekly.iloc[13] == 13.0
+
+    aligned = dm.get_aligned(
+        {"daily": datasource, "weekly": other_datasource}, [company], tolerance=datetime.timedelta(days=2)
+    )
+    # the day a week ends and the 2 days after, except after the last week, ending on the last day
+    assert aligned.weekly.notna().sum() == 3 * len(weekly_records) - 2
+
+    # labelled with the data source names by default
+    aligned = dm.get_aligned([datasource, other_datasource], [company], start_date=datetime.date(2019, 1, 1))
+    assert list(aligned.columns[4:]) == [datasource.name, other_datasource.name, other_datasource.name + "_end_date"]
+    assert aligned.end_date.min() >= pandas.Timestamp(2019, 1, 1)
+
+    with pytest.raises(DataMonsterError):
+        dm.get_aligned([datasource, datasource], [company])
+    with pytest.raises(DataMonsterError):
+        dm.get_aligned(
+            [datasource, other_datasource], [company, other_company], aggregation=Aggregation("fiscalQuarter", company)
+        )
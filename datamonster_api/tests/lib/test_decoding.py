@@ -0,0 +1,168 @@
+import fastavro
+import io
+import pandas
+import pytest
+
+from datamonster_api import DataMonsterError, RowFilter
+from datamonster_api.lib.decoding import (
+    avro_blocks, concat_frames, decode_avro, decode_avro_chunked, decode_avro_parallel, interned_dimensions,
+    iter_decode_avro
+)
+
+FIELDS = [
+    {"name": "period_end", "data_type": "date"},
+    {"name": "period_start", "data_type": "date"},
+    {"name": "avg_dollar_per_cust", "data_type": "number"},
+    {"name": "country", "data_type": "string"},
+    {"name": "category", "data_type": "string"},
+]
+
+
+def test_avro_blocks(other_avro_data_file):
+    buffer = other_avro_data_file.content
+    header_end, blocks = avro_blocks(buffer)
+
+    assert len(blocks) == 9
+    assert blocks[0][0] == header_end
+    assert blocks[-1][1] == len(buffer)
+    assert all(end == start for (_, end), (start, _) in zip(blocks, blocks[1:]))
+
+    # each range of blocks makes a valid avro file with the header
+    schema, df = decode_avro(io.BytesIO(buffer[:header_end] + buffer[blocks[1][0]:blocks[2][1]]), FIELDS)
+    assert 0 < len(df) < 2191
+
+    with pytest.raises(DataMonsterError):
+        avro_blocks(b"not avro")
+    with pytest.raises(DataMonsterError):
+        avro_blocks(buffer[:blocks[3][1] - 1])
+    with pytest.raises(DataMonsterError):
+        avro_blocks(buffer[:blocks[3][1] - 8] + b"x" * 8 + buffer[blocks[3][1]:])
+
+
+def test_decode_avro_parallel(other_avro_data_file):
+    buffer = other_avro_data_file.content
+    schema, df = decode_avro(io.BytesIO(buffer), FIELDS)
+
+    parallel_schema, parallel_df = decode_avro_parallel(buffer, FIELDS, 3)
+    assert parallel_schema == schema
+    assert parallel_df.equals(df)
+
+    row_filter = RowFilter(start_date="2019-06-01")
+    schema, df = decode_avro(io.BytesIO(buffer), FIELDS, row_filter, ["period_start", "category"])
+    schema, parallel_df = decode_avro_parallel(
+        buffer, FIELDS, 4, row_filter, lambda structure: structure["lower_date"] + ["category"]
+    )
+    assert len(df) > 0
+    assert parallel_df.equals(df)
+
+    # no rows left in any part
+    schema, df = decode_avro(io.BytesIO(buffer), FIELDS, RowFilter(equals={"country": "CA"}))
+    schema, parallel_df = decode_avro_parallel(buffer, FIELDS, 2, RowFilter(equals={"country": "CA"}))
+    assert len(parallel_df) == len(df) == 0
+    assert list(parallel_df.columns) == list(df.columns)
+
+
+def test_iter_decode_avro(other_avro_data_file):
+    buffer = other_avro_data_file.content
+    schema, df = decode_avro(io.BytesIO(buffer), FIELDS)
+
+    chunk_schema, chunks = iter_decode_avro(io.BytesIO(buffer), FIELDS, chunk_size=1000)
+    chunks = list(chunks)
+    assert chunk_schema == schema
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 191]
+    assert concat_frames(chunks).equals(df)
+
+    pytest.importorskip('pyarrow')
+    schema, tables = iter_decode_avro(io.BytesIO(buffer), FIELDS, chunk_size=1000, output="arrow")
+    assert [table.num_rows for table in tables] == [1000, 1000, 191]
+
+
+def test_decode_avro_chunked(other_avro_data_file):
+    buffer = other_avro_data_file.content
+    schema, df = decode_avro(io.BytesIO(buffer), FIELDS)
+
+    chunked_schema, chunked = decode_avro_chunked(io.BytesIO(buffer), FIELDS, chunk_size=1000)
+    assert chunked_schema == schema
+    assert chunked.equals(df)
+
+    schema, df = decode_avro_chunked(
+        io.BytesIO(buffer), FIELDS, RowFilter(equals={"country": "CA"}), ["period_start"], chunk_size=1000
+    )
+    assert len(df) == 0
+    assert list(df.columns) == ["period_start"]
+
+    pytest.importorskip('pyarrow')
+    schema, table = decode_avro_chunked(io.BytesIO(buffer), FIELDS, chunk_size=1000, output="arrow")
+    assert table.num_rows == 2191
+
+
+def test_decode_avro_chunked_missing_values():
+    """A chunk where a column holds no value still has the type of the column"""
+    pyarrow = pytest.importorskip('pyarrow')
+    schema = {
+        "type": "record",
+        "name": "rawdata",
+        "structure": {"lower_date": ["period_start"], "upper_date": ["period_end"], "split": ["country"]},
+        "fields": [
+            {"name": "period_end", "type": ["null", "string"]},
+            {"name": "period_start", "type": ["null", "string"]},
+            {"name": "avg_dollar_per_cust", "type": ["null", "double"]},
+            {"name": "country", "type": ["null", "string"]},
+            {"name": "category", "type": ["null", "string"]},
+        ],
+    }
+    records = [
+        {"period_end": None, "period_start": None, "avg_dollar_per_cust": None, "country": None, "category": None}
+    ] * 2 + [
+        {"period_end": "2019-01-07", "period_start": "2019-01-01", "avg_dollar_per_cust": 1.5, "country": "US",
+         "category": "Toys"}
+    ] * 2
+    buffer = io.BytesIO()
+    fastavro.writer(buffer, schema, records)
+
+    buffer.seek(0)
+    _, chunks = iter_decode_avro(buffer, FIELDS, chunk_size=2, output="arrow")
+    first, second = list(chunks)
+    assert first.schema == second.schema
+
+    buffer.seek(0)
+    _, table = decode_avro_chunked(buffer, FIELDS, chunk_size=2, output="arrow")
+    assert table.num_rows == 4
+    assert table.schema.field("period_end").type == pyarrow.timestamp("ns")
+    assert table.schema.field("avg_dollar_per_cust").type == pyarrow.float64()
+    assert pyarrow.types.is_dictionary(table.schema.field("country").type)
+    assert table.column("country").null_count == 2
+
+    # integer fields stay integers, as in pandas output
+    fields = [dict(col, data_type="integer") if col["name"] == "avg_dollar_per_cust" else col for col in FIELDS]
+    schema["fields"][2]["type"] = ["null", "long"]
+    records = [dict(record, avg_dollar_per_cust=None if record["period_end"] is None else 3) for record in records]
+    buffer = io.BytesIO()
+    fastavro.writer(buffer, schema, records)
+    buffer.seek(0)
+    _, table = decode_avro_chunked(buffer, fields, chunk_size=2, output="arrow")
+    assert table.schema.field("avg_dollar_per_cust").type == pyarrow.int64()
+    assert table.column("avg_dollar_per_cust").to_pylist() == [None, None, 3, 3]
+
+
+def test_row_filter_unknown_columns():
+    structure = {"lower_date": ["period_start"], "upper_date": ["period_end"], "split": ["country", "category"]}
+    keep = RowFilter(equals={"country": "US"}).compile(structure)
+    assert keep({"country": "US"})
+    assert not keep({"country": "CA"})
+
+    with pytest.raises(DataMonsterError):
+        RowFilter(equals={"contry": "US"}).compile(structure)
+
+
+def test_interned_dimensions():
+    df = pandas.DataFrame({
+        "country": pandas.Categorical(["US", None, "US", None]),
+        "category": ["a", "b", "a", "b"],
+    })
+    dimensions = interned_dimensions(df, ["country", "category"])
+    assert dimensions[0] is dimensions[2]
+    assert dimensions[1] is dimensions[3]
+    assert dimensions[0] == {"country": "US", "category": "a"}
+    assert dimensions[1]["category"] == "b" and pandas.isnull(dimensions[1]["country"])
+    assert list(interned_dimensions(df, [])) == [{}] * 4
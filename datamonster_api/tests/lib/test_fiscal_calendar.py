@@ -0,0 +1,78 @@
+import datetime
+import numpy
+import pandas
+import pytest
+
+from datamonster_api import DataMonsterError, FiscalCalendar
+
+# A retailer with a 52-53 week fiscal year ending around the start of January
+QUARTERS = [
+    "01-01-2000",
+    "04-22-2000", "07-15-2000", "10-07-2000", "12-30-2000",
+    "04-21-2001", "07-14-2001", "10-06-2001", "12-29-2001",
+    "04-20-2002", "07-13-2002",
+]
+
+
+def test_fiscal_calendar_numbering():
+    calendar = FiscalCalendar(QUARTERS)
+
+    assert list(calendar.fiscal_years) == [1999] + [2000] * 4 + [2001] * 4 + [2002] * 2
+    assert list(calendar.fiscal_quarters) == [4, 1, 2, 3, 4, 1, 2, 3, 4, 1, 2]
+
+    # quarters need not be sorted
+    assert list(FiscalCalendar(QUARTERS[::-1]).fiscal_quarters) == [4, 1, 2, 3, 4, 1, 2, 3, 4, 1, 2]
+
+    calendar = FiscalCalendar(["03-31-2019", "06-30-2019", "09-30-2019", "12-31-2019"], fiscal_year_end_month=6)
+    assert list(calendar.fiscal_years) == [2019, 2019, 2020, 2020]
+    assert list(calendar.fiscal_quarters) == [3, 4, 1, 2]
+
+    with pytest.raises(DataMonsterError):
+        FiscalCalendar([])
+
+
+def test_fiscal_calendar_label():
+    calendar = FiscalCalendar(QUARTERS)
+    dates = pandas.Series(
+        pandas.to_datetime(["2000-12-30", "2000-12-31", "2000-01-01", "2001-05-01", "2002-08-01", None]),
+        index=list("abcdef"),
+    )
+
+    labels = calendar.label(dates)
+
+    assert list(labels.index) == list("abcdef")
+    assert list(labels.fiscal_year[:4]) == [2000, 2001, 1999, 2001]
+    assert list(labels.fiscal_quarter[:4]) == [4, 1, 4, 2]
+    assert labels.period_start["a"] == pandas.Timestamp("2000-10-08")
+    assert labels.period_end["a"] == pandas.Timestamp("2000-12-30")
+    assert labels.period_start["d"] == pandas.Timestamp("2001-04-22")
+    assert labels.period_end["d"] == pandas.Timestamp("2001-07-14")
+
+    # first known quarter has no known start; after the last quarter nothing is known
+    assert pandas.isnull(labels.period_start["c"])
+    assert labels[["fiscal_year", "fiscal_quarter", "period_start", "period_end"]].loc[["e", "f"]].isnull().all().all()
+
+    labels = calendar.label([datetime.date(2001, 5, 1), numpy.datetime64("2001-12-29")])
+    assert list(labels.fiscal_quarter) == [2, 4]
+
+
+def test_company_fiscal_calendar(company):
+    company.set_details({"quarters": QUARTERS})
+
+    calendar = company.fiscal_calendar
+    assert calendar is company.fiscal_calendar
+    assert len(calendar.quarter_ends) == len(QUARTERS)
+
+    # fiscal years ending in another month
+    june = company.get_fiscal_calendar(6)
+    assert june is company.get_fiscal_calendar(6)
+    assert june.fiscal_year_end_month == 6
+    assert list(june.label(["2000-10-01"]).fiscal_year) == [2001]
+    assert list(calendar.label(["2000-10-01"]).fiscal_year) == [2000]
+    company.fiscal_year_end_month = 6
+    assert company.fiscal_calendar is june
+
+    # new details are picked up
+    company.set_details({"quarters": []})
+    with pytest.raises(DataMonsterError):
+        company.fiscal_calendar
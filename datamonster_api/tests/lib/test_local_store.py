@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+
+import pytest
+
+pyarrow = pytest.importorskip('pyarrow')
+
+from datamonster_api import LocalStore  # noqa: E402
+
+
+def test_local_store(tmpdir):
+    store = LocalStore(str(tmpdir.join("store")))
+    key = {"datasource": "abc", "filters": {"section_pk": [1]}}
+    table = pyarrow.table({"value": [1.0, 2.0], "name": ["a", "b"]})
+
+    assert store.get(key) is None
+    store.put(key, table)
+
+    allocated = pyarrow.total_allocated_bytes()
+    stored = store.get(key)
+    assert stored.equals(table)
+    assert pyarrow.total_allocated_bytes() == allocated
+    assert store.get(dict(key, datasource="other")) is None
+
+    store.max_age = 60
+    assert store.get(key) is not None
+    old = time.time() - 120
+    os.utime(store._file_path(key), (old, old))
+    assert store.get(key) is None
+
+    open(store._file_path(key) + ".lock", "w").close()
+    open(store._file_path(key) + ".123.tmp", "w").close()
+    store.clear()
+    store.max_age = None
+    assert store.get(key) is None
+    assert os.listdir(store.path) == []
+
+
+def test_local_store_get_or_create(tmpdir):
+    store = LocalStore(str(tmpdir.join("store")))
+    key = {"datasource": "abc"}
+    table = pyarrow.table({"value": [1.0, 2.0]})
+    created = []
+
+    def create():
+        created.append(1)
+        return table
+
+    assert store.get_or_create(key, create).equals(table)
+    assert store.get_or_create(key, create).equals(table)
+    assert len(created) == 1
+
+    # another process is creating the dataset: wait for it
+    other_key = {"datasource": "other"}
+    lock_path = store._file_path(other_key) + ".lock"
+    open(lock_path, "w").close()
+
+    def other_process():
+        time.sleep(0.3)
+        store.put(other_key, table)
+        os.remove(lock_path)
+
+    thread = threading.Thread(target=other_process)
+    thread.start()
+    assert store.get_or_create(other_key, create).equals(table)
+    thread.join()
+    assert len(created) == 1
+
+    # the process holding the lock died long ago: take it over without waiting
+    dead_key = {"datasource": "dead"}
+    lock_path = store._file_path(dead_key) + ".lock"
+    open(lock_path, "w").close()
+    old = time.time() - store.lock_timeout - 60
+    os.utime(lock_path, (old, old))
+    start = time.time()
+    assert store.get_or_create(dead_key, create).equals(table)
+    assert time.time() - start < store.lock_timeout
+    assert len(created) == 2
+    assert not os.path.exists(lock_path)
+
+
+def test_local_store_stale_lock_single_taker(tmpdir):
+    store = LocalStore(str(tmpdir.join("store")))
+    key = {"datasource": "dead"}
+    table = pyarrow.table({"value": [1.0, 2.0]})
+    created = []
+
+    def create():
+        created.append(1)
+        time.sleep(0.3)
+        return table
+
+    lock_path = store._file_path(key) + ".lock"
+    open(lock_path, "w").close()
+    old = time.time() - store.lock_timeout - 60
+    os.utime(lock_path, (old, old))
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_create(key, create)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 4
+    assert all(result.equals(table) for result in results)
+    assert len(created) == 1
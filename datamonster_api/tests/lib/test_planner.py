@@ -0,0 +1,50 @@
+import datetime
+
+from datamonster_api import CoveragePlanner
+
+
+def _dimension(section_pks, min_date, max_date, row_count, **splits):
+    splits["section_pk"] = section_pks
+    return {"split_combination": splits, "min_date": min_date, "max_date": max_date, "row_count": row_count}
+
+
+DIMENSIONS = [
+    _dimension([1], "2019-01-01", "2019-12-31", 365, country="US"),
+    _dimension([1], "2018-01-01", "2018-12-31", 365, country="UK"),
+    _dimension([2, 3], "2019-07-01", "2019-07-10", 10, country="US"),
+    _dimension([4], "2019-01-01", "2019-12-31", 1000, country="US"),
+    _dimension([5], "2019-01-01", "2019-12-31", 0, country="US"),
+]
+
+
+def test_coverage():
+    planner = CoveragePlanner(DIMENSIONS)
+    assert planner.coverage[1] == [datetime.date(2018, 1, 1), datetime.date(2019, 12, 31), 730]
+    assert planner.coverage[3] == [datetime.date(2019, 7, 1), datetime.date(2019, 7, 10), 10]
+
+    assert planner.covers(1)
+    assert planner.covers(2, start_date="2019-07-10")
+    assert not planner.covers(2, start_date="2019-07-11")
+    assert not planner.covers(2, end_date=datetime.date(2019, 6, 30))
+    assert not planner.covers(5)
+    assert not planner.covers(6)
+
+    assert planner.expected_rows(1) == 730
+    assert planner.expected_rows(1, start_date="2019-01-01") == 365
+    assert planner.expected_rows(2, "2019-07-01", "2019-07-05") == 5
+    assert planner.expected_rows(6) == 0
+
+
+def test_batches():
+    planner = CoveragePlanner(DIMENSIONS)
+    assert planner.batches([1, 2, 3, 4, 5, 6], max_rows=1000) == [[4], [1, 2, 3]]
+    assert planner.batches([1, 2, 3, 4, 5, 6], max_rows=1000, max_size=2) == [[4], [1, 2], [3]]
+    assert planner.batches([1, 2, 3, 4], max_rows=1000, start_date="2019-08-01") == [[1, 4]]
+
+
+def test_not_by_company():
+    planner = CoveragePlanner([{"split_combination": {"country": "US"}, "min_date": None, "max_date": None,
+                                "row_count": 10}])
+    assert planner.covers(1, start_date="2019-01-01")
+    assert planner.expected_rows(1) is None
+    assert planner.batches([3, 1, 2], max_rows=10, max_size=2) == [[1, 2], [3]]
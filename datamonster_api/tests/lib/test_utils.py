@@ -3,7 +3,9 @@ import numpy
 import pandas
 import pytest
 
-from datamonster_api import format_date
+from datamonster_api import DataMonsterError, format_date, format_dates
+from datamonster_api.lib import utils
+from datamonster_api.lib.utils import dataframe_to_avro_bytes, estimate_avro_size
 
 
 def test_good_date():
@@ -19,3 +21,81 @@ def test_bad_date():
     for item in items:
         with pytest.raises(ValueError):
             format_date(item)
+
+
+def test_format_dates():
+    dates = ["2019-02-01", "2019/02/01", datetime.date(2019, 1, 1), "2019-02-01", numpy.datetime64("2019-01-02")]
+    expected = ["2019-02-01", "2019-02-01", "2019-01-01", "2019-02-01", "2019-01-02"]
+    assert format_dates(dates) == expected
+    assert format_dates([]) == []
+
+    formatted = format_dates(numpy.array(dates, dtype=object))
+    assert isinstance(formatted, numpy.ndarray)
+    assert list(formatted) == expected
+
+    series = pandas.Series(pandas.to_datetime(["2019-01-02", "2019-01-03"]), index=[3, 4], name="date")
+    formatted = format_dates(series)
+    assert formatted.name == "date"
+    assert list(formatted.index) == [3, 4]
+    assert list(formatted) == ["2019-01-02", "2019-01-03"]
+
+
+def test_format_dates_extension_dtypes():
+    series = pandas.Series(pandas.date_range("2019-01-01 22:00", periods=2, freq="D", tz="US/Eastern"))
+    assert list(format_dates(series)) == [format_date(date) for date in series] == ["2019-01-01", "2019-01-02"]
+
+    series = pandas.Series(["2019/02/01", "2019-01-01", "2019/02/01"], dtype="category")
+    assert list(format_dates(series)) == ["2019-02-01", "2019-01-01", "2019-02-01"]
+
+
+def test_format_dates_parses_each_value_once(mocker):
+    parse = mocker.spy(utils.parser, "parse")
+    assert format_dates(["2019/02/01"] * 10 + ["2019-02-01"] * 10) == ["2019-02-01"] * 20
+    assert parse.call_count == 1
+
+
+def test_format_dates_bad_date():
+    items = ["garbage", "2018-10-1010", "2019-02-30", None, []]
+    for item in items:
+        with pytest.raises(ValueError):
+            format_dates(["2019-01-01", item])
+
+    with pytest.raises(ValueError):
+        format_dates(pandas.Series([pandas.Timestamp("2019-01-01"), pandas.NaT]))
+
+
+def test_estimate_avro_size():
+    df = pandas.DataFrame({
+        "number": [1, 2, 3],
+        "value": [1.5, 2.5, 3.5],
+        "string": ["a", "a much longer string", None],
+    })
+    estimate = estimate_avro_size(df)
+    assert 0 < estimate <= len(dataframe_to_avro_bytes(df, "name", "namespace"))
+    assert estimate > estimate_avro_size(df.assign(string=["a", "b", None]))
+
+
+def test_dataframe_to_avro_bytes_max_size():
+    df = pandas.DataFrame({"string": ["x" * 1000] * 1000})
+    assert len(dataframe_to_avro_bytes(df, "name", "namespace")) > 1000000
+
+    with pytest.raises(DataMonsterError):
+        dataframe_to_avro_bytes(df, "name", "namespace", max_size=100000)
+
+
+def test_read_dataframe_chunks_missing_values(tmpdir):
+    pytest.importorskip('pyarrow')
+    df = pandas.DataFrame({'number col': [1.0, None, 3.0], 'string col': ['a', None, 'c']})
+    dtypes = {'number col': float, 'string col': str}
+
+    chunks = {}
+    for extension in ('csv', 'parquet'):
+        path = str(tmpdir.join('upload.{}'.format(extension)))
+        if extension == 'csv':
+            df.to_csv(path, index=False)
+        else:
+            df.to_parquet(path, index=False)
+        chunks[extension] = pandas.concat(utils.read_dataframe_chunks(path, 2, dtypes=dtypes), ignore_index=True)
+
+    assert chunks['parquet'].equals(chunks['csv'])
+    assert list(chunks['parquet']['string col'].isna()) == [False, True, False]
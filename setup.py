@@ -2,6 +2,8 @@ import os
 import setuptools
 
 requires = ["avro-python3", "fastavro", "more-itertools", "numpy", "pandas", "requests", "six"]
+# Arrow output, Parquet files and the LocalStore
+extras = {"arrow": ["pyarrow"]}
 
 here = os.path.abspath(os.path.dirname(__file__))
 
@@ -30,6 +32,7 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     install_requires=requires,
+    extras_require=extras,
     python_requires=">=3.5",
     project_urls={
         "Documentation": "https://datamonster-api.readthedocs.io",